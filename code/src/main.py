@@ -1,9 +1,14 @@
 import os
 import json
 import base64
+import asyncio
 import logging
+import functools
+import sys
 
-from orchestrator import DAGExecutor
+from google.cloud import storage
+
+from orchestrator import DAGExecutor, OrchestratorService, RunIndex, TaskStatus, SinkFilter
 
 from orchestration_dag_definition import OrchestrationDagDefinition
 
@@ -21,12 +26,71 @@ def on_pub_sub_event(pub_sub_event, context):
     print(f"JSON data: {data}")
     data = json.loads(data)
 
+    check_sink_filters()
+    status_bucket_name = os.environ.get('STATUS_BUCKET', 'orchestration-status-bucket-edge-default')
+    DAGExecutor(dag_definition=OrchestrationDagDefinition.get_dag(), bucket_name=status_bucket_name,
+                concurrency_limits=get_concurrency_limits()).execute(data=data)
+
+
+def get_concurrency_limits():
+    # i.e. CONCURRENCY_LIMITS='{"Dataflow": 20, "CloudFunction/heavy-function": 5}'
+    return json.loads(os.environ.get('CONCURRENCY_LIMITS', '{}'))
+
+
+@functools.lru_cache(maxsize=None)
+def check_sink_filters():
+    # Runs once per instance: the deployed filters of the log sinks (DATAFLOW_SINK_FILTER, CLOUD_FUNCTION_SINK_FILTER)
+    # must be the ones generated from the DAG definition, with: python main.py sink_filters
+    outdated = SinkFilter([OrchestrationDagDefinition.get_dag()]).check_deployed(
+        dataflow_filter=os.environ.get('DATAFLOW_SINK_FILTER'),
+        cloud_function_filter=os.environ.get('CLOUD_FUNCTION_SINK_FILTER')
+    )
+    if outdated:
+        print(f"WARNING: The log sink filters are not generated from the DAG definition: {', '.join(outdated)}")
+    return not outdated
+
+
+def query_runs(request):
+    """HTTP entry point for the run index, i.e. for dashboards: ?state=Running&node_name=Step1&page_size=50
+    Returns the matching runs with their state, start and finish times, and running Nodes, and the next page token.
+    """
+
+    status_bucket_name = os.environ.get('STATUS_BUCKET', 'orchestration-status-bucket-edge-default')
+    bucket = storage.Client().get_bucket(status_bucket_name)
+    args = request.args
+    state = args.get('state')
+    runs, next_page_token = RunIndex(bucket).query(
+        state=TaskStatus(state) if state else None,
+        started_after=int(args['started_after']) if 'started_after' in args else None,
+        started_before=int(args['started_before']) if 'started_before' in args else None,
+        node_name=args.get('node_name'),
+        page_size=int(args.get('page_size', 100)),
+        page_token=args.get('page_token')
+    )
+    return {'runs': runs, 'next_page_token': next_page_token}
+
+
+def run_service():
+    """Runs the orchestrator as a long-running service (i.e. on Cloud Run or a VM) instead of a Cloud Function.
+    It pulls the same events from the Pub/Sub subscription defined by EVENTS_SUBSCRIPTION.
+    """
+
     status_bucket_name = os.environ.get('STATUS_BUCKET', 'orchestration-status-bucket-edge-default')
-    DAGExecutor(dag_definition=OrchestrationDagDefinition.get_dag(), bucket_name=status_bucket_name).execute(data=data)
+    subscription = os.environ['EVENTS_SUBSCRIPTION']
+    checkpoint_interval = float(os.environ.get('CHECKPOINT_INTERVAL', 5))
+    check_sink_filters()
+
+    service = OrchestratorService(dag_definition=OrchestrationDagDefinition.get_dag(), bucket_name=status_bucket_name,
+                                  checkpoint_interval=checkpoint_interval, concurrency_limits=get_concurrency_limits())
+    asyncio.get_event_loop().run_until_complete(service.serve(subscription=subscription))
 
 
 if __name__ == '__main__':
-    event = {"resource": {"type": "start"}}
+    if sys.argv[1:] == ['sink_filters']:
+        # python main.py sink_filters > ../../infrastructure/terraform/sink_filters.auto.tfvars.json
+        print(json.dumps(SinkFilter([OrchestrationDagDefinition.get_dag()]).to_tfvars(), indent=2))
+    else:
+        event = {"resource": {"type": "start"}}
 
-    test_data = base64.b64encode(json.dumps(event).encode('utf-8'))
-    on_pub_sub_event({'data': test_data}, None)
+        test_data = base64.b64encode(json.dumps(event).encode('utf-8'))
+        on_pub_sub_event({'data': test_data}, None)
@@ -20,6 +20,11 @@ class OrchestrationDagDefinition:
                     "function": trigger_step_1,
                     "project_id": "trv-hs-src-consolidation-test",
                     "region": "europe-west1",
+                    "retry": {
+                        "max_attempts": 3,
+                        "interval_seconds": 60,
+                        "backoff_rate": 2.0
+                    },
                     "next": "Step2"
                 },
                 "Step2": {
@@ -1,8 +1,16 @@
-from .enums import NodeTypes, TargetTypes, TaskStatus, DataflowTemplateType
-from .nodes import Node, Task, Function, CloudFunctionTask, DataflowJob, Parallel
+from .enums import NodeTypes, TargetTypes, TaskStatus, DataflowTemplateType, ScheduledEvents, LaunchModes, PoolTypes
+from .nodes import Node, Task, Function, CloudFunctionTask, DataflowJob, Parallel, Condition, Map, SubWorkflow
 from .dag import DAG
 from .node_factory import NodeFactory
 from .dag_builder import DAGBuilder
 from .dag_executor import DAGExecutor
-from .status import OrchestrationStatus, ExecutionStatus
-from .events import Event, EventsFactory, DataflowEvent, CloudFunctionEvent
+from .status import OrchestrationStatus, ExecutionStatus, BufferedExecutionStatus, RunIndex, CacheStatus
+from .events import Event, EventsFactory, DataflowEvent, CloudFunctionEvent, Start, Resume, Retry, Dequeue, TaskTimeout
+from .service import OrchestratorService
+from .retry_policy import RetryPolicy
+from .dataflow_poller import DataflowJobPoller
+from .launch_limiter import LaunchLimiter
+from .watchdog import TaskWatchdog
+from .result_cache import ResultCache
+from .bindings import Bindings
+from .sink_filters import SinkFilter
@@ -0,0 +1,40 @@
+import re
+
+
+class Bindings:
+    # Resolves the references to the data of a run in the parameters (and outputs) of the Steps:
+    # "gs://bucket/staging/${run_id}/", "${parameters.date}", "${outputs.Step1.uri}", "${item.shard}"
+    # A value that is only a reference gets the referenced value as it is (i.e. a dict or a list), and the references
+    # inside a longer string are replaced by their string values.
+    REFERENCE_PATTERN = re.compile(r"\$\{([^}]+)\}")
+
+    @classmethod
+    def resolve(cls, value, context, strict=True):
+        # With strict=False, the references that can't be resolved are kept as they are, instead of raising KeyError.
+        if isinstance(value, dict):
+            return {key: cls.resolve(item, context, strict) for key, item in value.items()}
+        if isinstance(value, list):
+            return [cls.resolve(item, context, strict) for item in value]
+        if not isinstance(value, str):
+            return value
+
+        match = cls.REFERENCE_PATTERN.fullmatch(value)
+        if match:
+            return cls._lookup(match.group(1), context, strict, match.group(0))
+        return cls.REFERENCE_PATTERN.sub(
+            lambda reference: str(cls._lookup(reference.group(1), context, strict, reference.group(0))), value
+        )
+
+    @staticmethod
+    def _lookup(path, context, strict, reference):
+        value = context
+        for part in path.strip().split('.'):
+            if isinstance(value, dict) and part in value:
+                value = value[part]
+            elif isinstance(value, list) and part.isdigit() and int(part) < len(value):
+                value = value[int(part)]
+            elif strict:
+                raise KeyError(f"The reference can't be resolved: {reference}")
+            else:
+                return reference
+        return value
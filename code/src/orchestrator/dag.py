@@ -3,7 +3,8 @@ from .enums import NodeTypes
 
 
 class DAG:
-    def __init__(self, nodes: dict, start_node_name: str, parent_step: Node, exec_status, orchestration_status):
+    def __init__(self, nodes: dict, start_node_name: str, parent_step: Node, exec_status, orchestration_status,
+                 workflow_node: Node = None):
         self._nodes = nodes
         self._start = start_node_name
         self._parent = parent_step
@@ -12,6 +13,8 @@ class DAG:
         self._tasks = None
         self._all_nodes = None
         self._all_tasks = None
+        # The SubWorkflow Node that this DAG (or one of its parent DAGs) was expanded for, if any.
+        self._workflow_node = workflow_node
 
     def init(self):
         # We need to explicitly call this function to initialize the DAG.
@@ -52,6 +55,10 @@ class DAG:
     def all_nodes(self):
         return self._all_nodes
 
+    @property
+    def workflow_node(self):
+        return self._workflow_node
+
     @property
     def start_node(self):
         return self._nodes.get(self._start)
@@ -59,6 +66,32 @@ class DAG:
     def get_node_with_task(self, task_name):
         return self._tasks.get(task_name)
 
+    def get_binding_context(self):
+        # The data of the run that the Steps of this DAG can refer to (see Bindings). Inside a SubWorkflow, the
+        # outputs are the ones of its own Steps (by their names in the workflow), and its parameters are "workflow".
+        orchestration_status = self._orchestration_status
+        context = {
+            'run_id': orchestration_status.run_id,
+            'parameters': orchestration_status.run_parameters,
+            'outputs': orchestration_status.run_outputs
+        }
+        if self._workflow_node:
+            scope = self._workflow_node.scope
+            context['outputs'] = {
+                node_name[len(scope):]: output
+                for node_name, output in context['outputs'].items() if node_name.startswith(scope)
+            }
+            context['workflow'] = self._workflow_node.get_parameters()
+        return context
+
+    def add_branch_nodes(self, branch):
+        # Adds the Nodes of a branch that was built after this DAG (i.e. an expanded SubWorkflow) to this DAG and to
+        # its parent DAGs, so the events of its Tasks can find them.
+        dag = self
+        while dag:
+            self._traverse_all_nodes(branch, dag._all_nodes, dag._all_tasks)
+            dag = dag.parent_node.parent_dag if dag.parent_node else None
+
     def _get_all_nodes(self):
         nodes = {}
         tasks = {}
@@ -72,6 +105,5 @@ class DAG:
             if node.node_type == NodeTypes.TASK:
                 tasks[node.target_name] = node
 
-            if node.node_type == NodeTypes.PARALLEL:
-                for branch in node.branches:
-                    self._traverse_all_nodes(branch, nodes, tasks)
+            for branch in node.branches:
+                self._traverse_all_nodes(branch, nodes, tasks)
@@ -5,12 +5,17 @@ from .dag import DAG
 
 class DAGBuilder:
 
-    def __init__(self, dag, exec_status, orchestration_status):
+    def __init__(self, dag, exec_status, orchestration_status, workflows=None, workflow_node=None):
         self._dag = dag
         self._steps = None
         self._nodes = dict()
         self._exec_status = exec_status
         self._orchestration_status = orchestration_status
+        # The named workflows that the SubWorkflow Steps refer to, and the SubWorkflow Node whose workflow is built
+        # by this builder (if any). The Steps of a workflow are scoped under the name of its SubWorkflow Node.
+        self._workflows = dag.get('workflows', dict()) if workflows is None else workflows
+        self._workflow_node = workflow_node
+        self._scope = workflow_node.scope if workflow_node else ''
 
     def _build(self, node, functions_list):
         # This function recursively builds the DAG and the child DAGs.
@@ -20,10 +25,34 @@ class DAGBuilder:
             # TODO: Don't append everything for Parallels
             functions_list.append((k, v))
 
-            if node_type == 'Parallel':
+            if node_type == NodeTypes.PARALLEL.value:
                 branches = v['branches']
                 for branch in branches:
                     self._build(branch, functions_list)
+            elif node_type == NodeTypes.CONDITION.value:
+                for branch in self._get_condition_branches(v):
+                    self._build(branch, functions_list)
+            elif node_type == NodeTypes.MAP.value:
+                # The items of a Map Node are tracked per Task, so its iterator can only be a chain of Tasks. A failed
+                # item fails the Map Node, so the Tasks can't have a retry policy either.
+                for step_name, step in v['iterator']['steps'].items():
+                    if step['type'] != NodeTypes.TASK.value:
+                        raise Exception(f"Only Tasks are supported in the iterator of a Map: {step_name}")
+                    if 'retry' in step:
+                        raise Exception(f"Retries are not supported in the iterator of a Map: {step_name}")
+                self._build(v['iterator'], functions_list)
+            elif node_type == NodeTypes.SUB_WORKFLOW.value:
+                # The Steps of the workflow are only extracted when the workflow is built (see expand_sub_workflow).
+                if v['workflow'] not in self._workflows:
+                    raise Exception(f"Unknown workflow: {v['workflow']} in the Step: {k}")
+
+    @staticmethod
+    def _get_condition_branches(step):
+        # The branches of the choices, followed by the default branch (if any).
+        branches = list(step['choices'])
+        if step.get('default'):
+            branches.append(step['default'])
+        return branches
 
     def _extract_steps(self, dag):
         steps_list = []
@@ -31,6 +60,10 @@ class DAGBuilder:
         step_names = dict()
 
         for step_name, step in steps_list:
+            step_name = self._scope + step_name
+            if self._scope:
+                # The definition of a workflow is shared by all of its SubWorkflow Nodes.
+                step = dict(step)
             step['step_name'] = step_name
 
             if step_name not in step_names:
@@ -42,10 +75,13 @@ class DAGBuilder:
 
     def _build_dag(self, sub_dag, parent_node=None):
         # This function recursively creates DAGs according to the DAG definition.
-        start_step_name = sub_dag['start']
+        start_step_name = self._scope + sub_dag['start']
         nodes = dict()
-        dag = DAG(nodes, start_step_name, parent_node, self._exec_status, self._orchestration_status)
+        dag = DAG(nodes, start_step_name, parent_node, self._exec_status, self._orchestration_status,
+                  self._workflow_node)
         for step_name, step in sub_dag['steps'].items():
+            step_name = self._scope + step_name
+            step = self._steps[step_name]
             node = self._get_node(step_name, step, dag)
 
             if node.node_type == NodeTypes.PARALLEL:
@@ -53,10 +89,20 @@ class DAGBuilder:
                 for branch in branches:
                     # Create a new DAG for each branch
                     node.add_branch(self._build_dag(branch, node))
+            elif node.node_type == NodeTypes.CONDITION:
+                for branch in self._get_condition_branches(step):
+                    node.add_branch(self._build_dag(branch, node), branch.get('condition'))
+            elif node.node_type == NodeTypes.MAP:
+                node.set_iterator(self._build_dag(step['iterator'], node))
+            elif node.node_type == NodeTypes.SUB_WORKFLOW and node.status != TaskStatus.NEW and not node.status.is_done:
+                # Only the workflows that are running (or failed, so they can be resumed) are built with the DAG. The
+                # others are built when the run reaches them.
+                node.set_workflow(self._build_sub_workflow(node))
 
             # Set the next Node for the current Node
             next_step_name = step.get('next')
             if next_step_name:
+                next_step_name = self._scope + next_step_name
                 next_step = self._steps[next_step_name]
                 next_node = self._get_node(next_step_name, next_step, dag)
                 node.set_next(next_node)
@@ -81,10 +127,45 @@ class DAGBuilder:
             if orchestration_node and 'status' in orchestration_node:
                 node.set_status(TaskStatus(orchestration_node['status']))
 
+            if orchestration_node and node.node_type == NodeTypes.TASK:
+                node.set_attempts(orchestration_node.get('attempts', 0))
+                node.set_resumed_at(orchestration_node.get('resumed_at', 0))
+                node.set_execution_id(orchestration_node.get('execution_id'))
+                node.set_error(orchestration_node.get('error'))
+
+            if orchestration_node and node.node_type == NodeTypes.MAP:
+                node.load_state(orchestration_node)
+
         return node
 
-    def build_dag(self):
+    def _build_sub_workflow(self, node):
+        workflow_node = node.parent_dag.workflow_node
+        while workflow_node:
+            if workflow_node.workflow_name == node.workflow_name:
+                raise Exception(f"The workflow {node.workflow_name} is recursive in the Step: {node.node_name}")
+            workflow_node = workflow_node.parent_dag.workflow_node
+
+        builder = DAGBuilder(dag=self._workflows[node.workflow_name], exec_status=self._exec_status,
+                             orchestration_status=self._orchestration_status, workflows=self._workflows,
+                             workflow_node=node)
+        return builder.build_dag(parent_node=node)
+
+    def expand_sub_workflow(self, node):
+        # Builds the workflow of a SubWorkflow Node that the run just reached, and adds its Nodes to the DAG and to
+        # the Orchestration Status of the run.
+        workflow = self._build_sub_workflow(node)
+        node.set_workflow(workflow)
+        node.parent_dag.add_branch_nodes(workflow)
+        for workflow_node in workflow.all_nodes.values():
+            self._orchestration_status.update_task_status(workflow_node)
+        return workflow
+
+    def get_steps(self):
+        # All the Steps of the DAG definition (including the ones in the branches), by their names.
+        return self._extract_steps(self._dag)
+
+    def build_dag(self, parent_node=None):
         # We need to extract the steps separately to ensure we have all the nodes before building the DAG.
         self._steps = self._extract_steps(self._dag)
-        dag = self._build_dag(self._dag)
+        dag = self._build_dag(self._dag, parent_node)
         return dag
@@ -1,21 +1,66 @@
+import json
+import time
+import functools
+import traceback
+
 from google.cloud import storage
 
 from .dag_builder import DAGBuilder
-from .status import OrchestrationStatus, ExecutionStatus
-from .events import EventsFactory
-from .enums import TargetTypes, TaskStatus, NodeTypes
+from .status import OrchestrationStatus, ExecutionStatus, RetryStatus
+from .events import EventsFactory, DataflowEvent, Retry, TaskTimeout
+from .dataflow_poller import DataflowJobPoller
+from .watchdog import TaskWatchdog
+from .retry_policy import RetryPolicy
+from .launch_limiter import LaunchLimiter
+from .result_cache import ResultCache
+from .sink_filters import SinkFilter
+from .enums import TargetTypes, TaskStatus, NodeTypes, ScheduledEvents
 
 
 class DAGExecutor:
-    def __init__(self, dag_definition, bucket_name):
+    # The statuses of the Nodes that a run is waiting for.
+    ACTIVE_STATUSES = (TaskStatus.PENDING, TaskStatus.RETRYING, TaskStatus.QUEUED)
+    # The max size (as JSON) of an output reference that is returned by a Task, as the data itself must not be passed
+    # through the orchestrator.
+    MAX_OUTPUT_SIZE = 4096
+
+    def __init__(self, dag_definition, bucket_name, concurrency_limits=None):
         self._dag_definition = dag_definition
         self._bucket_name = bucket_name
         self._bucket = storage.Client().get_bucket(bucket_name)
         self._orchestration_status = OrchestrationStatus(self._bucket)
         self._exec_status = ExecutionStatus(self._bucket)
+        self._retry_status = RetryStatus(self._bucket)
+        self._launch_limiter = LaunchLimiter(self._bucket, concurrency_limits)
+        self._result_cache = ResultCache(self._bucket)
+        self._sink_filter = SinkFilter([dag_definition])
+        # The launches that were taken from the launch queue, as they can belong to other runs.
+        self._dequeued = []
+
+    def _matches_sink_filter(self, data):
+        # The deployed log sinks can be broader than the DAG needs (see SinkFilter), i.e. when they were not updated
+        # after a change of the DAG definition. Such an event can't belong to a run, so it's dropped before any read.
+        if self._sink_filter.matches(data):
+            return True
+        print(f"WARNING: The event doesn't match the sink filters of the DAG: {data['resource']}")
+        return False
 
     def execute(self, data):
 
+        scheduled_event = EventsFactory.get_scheduled_event(data)
+        if scheduled_event == ScheduledEvents.DATAFLOW_POLL:
+            self.poll_dataflow_jobs()
+            return
+        elif scheduled_event == ScheduledEvents.RETRY_POLL:
+            self.run_due_retries()
+            return
+        elif scheduled_event == ScheduledEvents.WATCHDOG:
+            self.sweep_stuck_tasks()
+            return
+
+        if not self._matches_sink_filter(data):
+            return
+
         task = EventsFactory.create_from_event(event_data=data)
 
         if not task:
@@ -23,115 +68,717 @@ class DAGExecutor:
             return
 
         # First, we need to initialize the Execution Status and Orchestration Status objects with the run_id.
-        if task.target_type == TargetTypes.START:
-            # If it's the start event, get the run_id from the Start event.
-            run_id = task.run_id
-            self._orchestration_status.set_run_id(run_id)
+        run_id = self._resolve_run_id(task)
+        if not run_id:
+            print(f"No run found for the execution: {task.execution_id}")
+            return
+
+        self._orchestration_status.set_run_id(run_id)
+        print(f"Run ID: {run_id}")
+
+        dag = self._build_dag(self._orchestration_status)
+        next_nodes = self._process_event(task, dag)
+        if not next_nodes:
+            print(f"No next node found.")
+
+        try:
+            self._advance(next_nodes)
+        finally:
+            # The Orchestration Status is saved only once, with all the transitions of this invocation. It's still
+            # saved if a launch raises, so the Tasks that were already launched are not lost.
+            self._summarize_run(dag)
+            self._orchestration_status.save_orchestration_status()
+
+        self._launch_dequeued()
+
+    def _summarize_run(self, dag):
+        # Updates the state and the running Nodes of the run, for the run index.
+        root_statuses = [node.status for node in dag.nodes.values()]
+        if TaskStatus.FAILED in root_statuses:
+            state = TaskStatus.FAILED
+        elif all(status.is_done for status in root_statuses):
+            state = TaskStatus.COMPLETED
         else:
-            # If it's an intermediate task/event, retrieve the run_id from the saved execution.
-            execution = self._exec_status.get_execution(task.execution_id)
-            run_id = execution['run_id']
+            state = TaskStatus.PENDING
 
-            task.set_run_id(run_id)
-            self._orchestration_status.set_run_id(run_id)
+        frontier = [
+            node_name for node_name, node in dag.all_nodes.items()
+            if node.node_type in (NodeTypes.TASK, NodeTypes.MAP) and node.status in self.ACTIVE_STATUSES
+        ]
+        dag.orchestration_status.set_run_summary(state, frontier)
 
-            print(f"Execution: {execution}")
+    def _launch_dequeued(self):
+        dequeued, self._dequeued = self._dequeued, []
+        for event_data in dequeued:
+            self.execute(event_data)
 
-        print(f"Run ID: {run_id}")
+    def _advance(self, next_nodes):
+        # Launches the next Tasks, and keeps advancing through the DAG in the same invocation as long as they are
+        # completed within their launch (i.e. the in-process Functions). The Conditions, the skipped branches and the
+        # joins on the way are resolved by _expand, so this only stops at the running Tasks and the pending joins.
+        while next_nodes:
+            finished_successors = []
+            for next_node in next_nodes:
+                print(f"Next node: {next_node.node_name}")
+                execution = self._get_cached_execution(next_node)
+                if not execution:
+                    if not self._acquire_slots(next_node):
+                        continue
+                    execution, _ = next_node.execute()
+                finished_successors.extend(self._after_launch(next_node, execution))
+            next_nodes = finished_successors
 
-        dag = DAGBuilder(dag=self._dag_definition, exec_status=self._exec_status,
-                         orchestration_status=self._orchestration_status).build_dag()
-        all_tasks = dag.all_tasks
+    def _after_launch(self, node, execution):
+        # Returns the Tasks to launch next if the Task is already done (i.e. an in-process Function, or a cached one).
+        # A launch that was taken from the launch queue leaves the queue only now, so it's not lost if the launch
+        # doesn't happen (see LaunchLimiter.dequeue).
+        self._launch_limiter.remove(node.queue_entry)
+        node.set_queue_entry(None)
+        if node.status != TaskStatus.PENDING:
+            # The Task doesn't run anymore, so its slots can be used by the queued launches.
+            self._release_slots(node.slots)
+        self._handle_launch_failures(node)
+        if node.status == TaskStatus.COMPLETED:
+            self._save_result(execution)
+            self._record_output(node, execution)
+        return self._get_finished_successors(node, execution)
+
+    def _get_cached_execution(self, node):
+        # Returns the cached execution if the result of the Task is cached, and completes the Task with it.
+        if node.cache is None:
+            return None
+
+        try:
+            cache_key = self._result_cache.get_key(node)
+            result = self._result_cache.get_result(node, cache_key)
+        except Exception as e:
+            # The cache is only an optimization, so the Task is launched anyway.
+            print(f"Error in reading the cache of the Task: {node.node_name} --> {e}")
+            traceback.print_exc()
+            return None
+
+        node.set_cache_key(cache_key)
+        if not result:
+            return None
+
+        print(f"Cached result of {node.node_name}: {result['execution_id']} ({result['run_id']})")
+        node.set_status(TaskStatus.COMPLETED)
+        if node.map_index is None:
+            node.parent_dag.orchestration_status.update_task_status(node)
+        return result
+
+    def _record_output(self, node, execution):
+        # Keeps the reference to the output of a completed Task in the run, so the next Steps can refer to it. The
+        # output of the Step can be updated by the Task itself, with an "output" object in its response.
+        if node.map_index is not None or not execution:
+            return
+
+        output = dict(execution.get('output') or {})
+        response = execution.get('response')
+        if isinstance(response, str):
+            try:
+                response = json.loads(response)
+            except ValueError:
+                response = None
+        if isinstance(response, dict) and isinstance(response.get('output'), dict):
+            if len(json.dumps(response['output'])) <= self.MAX_OUTPUT_SIZE:
+                output.update(response['output'])
+            else:
+                print(f"The output returned by {node.node_name} is too big for a reference, so it's ignored.")
+
+        if output:
+            node.parent_dag.orchestration_status.set_output(node.node_name, output)
+
+    def _save_result(self, execution):
+        # Caches the execution of a completed Task, if the Task is cached.
+        if execution and execution.get('cache_key'):
+            self._result_cache.save_result(execution)
+
+    def poll_dataflow_jobs(self):
+        # Fallback for the Dataflow jobs whose terminal log lines didn't reach the orchestrator.
+        for event_data in DataflowJobPoller(self._exec_status).poll():
+            self.execute(event_data)
+
+    def sweep_stuck_tasks(self):
+        # Fails the executions that didn't report their completion before their deadline, so their runs go on with
+        # the retry policies of the Tasks (or fail) instead of waiting forever.
+        for event_data in TaskWatchdog(self._exec_status).sweep():
+            self.execute(event_data)
+
+    def run_due_retries(self):
+        for retry in self._retry_status.get_due_retries(int(time.time())):
+            self.execute(Retry.event_data(**retry))
+
+        # The retry poll also picks up the queued launches that have a free slot but were not launched yet.
+        self._dequeued.extend(self._launch_limiter.dequeue_free())
+        self._launch_dequeued()
+
+    def _acquire_slots(self, node):
+        # Takes the launch slots of the Task, or puts it in the launch queue if one of its limits is reached.
+        # Returns whether the Task can be launched now.
+        orchestration_status = node.parent_dag.orchestration_status
+        slots, full_key = self._launch_limiter.acquire(node, orchestration_status.run_id)
+        if slots is None:
+            print(f"The limit of {full_key} is reached, so {node.node_name} is queued.")
+            self._launch_limiter.enqueue(full_key, orchestration_status.run_id, node,
+                                         orchestration_status.run_priority, node.enqueued)
+            node.set_queue_entry(None)
+            node.set_status(TaskStatus.QUEUED)
+            if node.map_index is None:
+                orchestration_status.update_task_status(node)
+            # A new launch is queued behind the waiting ones even if a slot is free, so the head of the queue is
+            # launched in its place.
+            self._dequeued.extend(self._launch_limiter.dequeue_free([full_key]))
+            return False
+
+        node.set_slots(slots)
+        return True
+
+    def _release_slots(self, slots):
+        # Each released slot is given to the next launch in the queue of its limit.
+        released_keys = self._launch_limiter.release(slots)
+        self._dequeued.extend(self._launch_limiter.dequeue(released_keys))
+
+    def _resolve_run_id(self, task):
+        if task.target_type in (TargetTypes.START, TargetTypes.RESUME, TargetTypes.RETRY, TargetTypes.DEQUEUE):
+            # If it's the start event (or a resume, a retry or a dequeue), the run_id is in the event itself.
+            return task.run_id
+
+        # If it's an intermediate task/event, retrieve the run_id from the saved execution.
+        execution = self._exec_status.get_execution(task.execution_id)
+        if not execution and task.trace_id:
+            # The asynchronously launched Cloud Functions are tracked with the trace ID of the launch request.
+            execution = self._exec_status.get_execution(task.trace_id)
+        print(f"Execution: {execution}")
+        task.set_execution(execution)
+
+        run_id = execution.get('run_id')
+        task.set_run_id(run_id)
+        return run_id
+
+    def _build_dag(self, orchestration_status):
+        return DAGBuilder(dag=self._dag_definition, exec_status=self._exec_status,
+                          orchestration_status=orchestration_status).build_dag()
+
+    def _schedule_retry(self, run_id, node, delay):
+        due = int(time.time() + delay)
+        print(f"Retrying {node.node_name} (attempt {node.attempts + 1}) in {delay:.1f} seconds.")
+        self._retry_status.schedule(run_id, node.node_name, node.attempts, due)
+        return due
+
+    def _handle_failure(self, node):
+        # Schedules a retry for the failed Task if its retry policy allows it. Otherwise, the failure is propagated
+        # to the parent Nodes, so the run doesn't wait for the Task forever.
+        orchestration_status = node.parent_dag.orchestration_status
+        retry_policy = node.retry_policy
+
+        if retry_policy and retry_policy.should_retry(node.error, node.retry_attempts):
+            node.set_status(TaskStatus.RETRYING)
+            orchestration_status.update_task_status(node)
+            self._schedule_retry(orchestration_status.run_id, node, retry_policy.get_delay(node.retry_attempts))
+            return
+
+        print(f"Task failed: {node.node_name} ({node.error}) after {node.attempts} attempt(s).")
+        self._fail_parents(node)
+
+    def _fail_parents(self, node):
+        orchestration_status = node.parent_dag.orchestration_status
+        parent_node = node.parent_dag.parent_node
+        while parent_node:
+            parent_node.set_status(TaskStatus.FAILED)
+            orchestration_status.update_task_status(parent_node)
+            parent_node = parent_node.parent_dag.parent_node
+
+        print(f"The run failed: {orchestration_status.run_id}")
+
+    def _handle_launch_failures(self, node):
+        if node.node_type == NodeTypes.TASK and node.status == TaskStatus.FAILED:
+            if node.map_index is not None:
+                self._fail_map_item(node.parent_dag.parent_node, node.map_index)
+            else:
+                self._handle_failure(node)
+
+    def _get_finished_successors(self, node, execution):
+        # Returns the Tasks to launch after a Task that is already completed when its launch returns.
+        if node.node_type != NodeTypes.TASK or node.status != TaskStatus.COMPLETED:
+            return []
+
+        print(f"Task finished within its launch: {node.node_name}")
+        orchestration_status = node.parent_dag.orchestration_status
+        if node.map_index is not None:
+            next_nodes = self._process_map_item(node, node.map_index, node.status)
+        else:
+            next_nodes = self._get_successors(node)
+        get_response = functools.lru_cache()(lambda: node.parent_dag.exec_status.get_response(execution))
+        return self._expand(next_nodes, get_response, orchestration_status.run_parameters)
+
+    def _fail_map_item(self, map_node, index):
+        # A failed item fails the whole Map Node. The other running items can still finish, but nothing else is
+        # launched for it.
+        print(f"Item {index} failed in the Map: {map_node.node_name}")
+        map_node.set_item_failed(index)
+        map_node.set_status(TaskStatus.FAILED)
+        map_node.parent_dag.orchestration_status.update_task_status(map_node)
+        self._fail_parents(map_node)
+
+    def _launch_map_items(self, map_node):
+        # Returns the Tasks for the items that can be launched within the max_concurrency of the Map Node.
+        start_node = map_node.iterator.start_node
+        tasks = []
+        for index in map_node.get_items_to_launch():
+            map_node.set_running(index, start_node.node_name)
+            tasks.append(start_node.for_map_item(index, map_node.items[index]))
+        return tasks
+
+    def _cancel_timed_out(self, node, execution):
+        if node.target_type == TargetTypes.DATAFLOW_JOB:
+            TaskWatchdog(node.parent_dag.exec_status).cancel(execution)
+
+    def _process_map_item(self, node, index, status, execution=None, timed_out=False):
+        map_node = node.parent_dag.parent_node
+        orchestration_status = map_node.parent_dag.orchestration_status
+
+        if execution:
+            # The execution is over even if the item is not running anymore (i.e. after another item failed the Map
+            # Node), so it doesn't keep its slots or its in-flight marker.
+            node.parent_dag.exec_status.clear_in_flight(node.target_type.value, execution['execution_id'])
+            self._release_slots(execution.get('slots'))
+
+        if map_node.status != TaskStatus.PENDING or map_node.running.get(index) != node.node_name:
+            print(f"This item is not running: {node.node_name} (item {index})")
+            return []
+
+        if timed_out:
+            self._cancel_timed_out(node, execution)
+
+        if execution and status == TaskStatus.COMPLETED:
+            self._save_result(execution)
+
+        if status == TaskStatus.FAILED:
+            self._fail_map_item(map_node, index)
+            return []
+
+        if not node.is_end:
+            # The item continues with the next Task of the iterator.
+            map_node.set_running(index, node.next.node_name)
+            orchestration_status.update_task_status(map_node)
+            return [node.next.for_map_item(index, map_node.items[index])]
+
+        # The item is done, so its place can be taken by the next item.
+        map_node.set_item_completed(index)
+        next_tasks = self._launch_map_items(map_node)
+        if map_node.all_items_completed:
+            print(f"All the items are done in the Map: {map_node.node_name}")
+            map_node.set_status(TaskStatus.COMPLETED)
+            orchestration_status.update_task_status(map_node)
+            return self._get_successors(map_node)
+
+        orchestration_status.update_task_status(map_node)
+        return next_tasks
 
-        # This defines the next node that should be triggered.
-        next_node = None
+    def _process_retry(self, task, dag):
+        self._retry_status.remove(task.run_id, task.task_name, task.attempts, task.due)
+
+        node = dag.all_nodes.get(task.task_name)
+        if not node or node.status != TaskStatus.RETRYING or node.attempts != task.attempts:
+            # The retry was already executed (i.e. by both the timer of the service and the scheduled event).
+            print(f"This retry is not due anymore: {task.task_name} (attempt {task.attempts + 1})")
+            return []
+
+        return [node]
+
+    def _process_dequeue(self, task, dag):
+        node = dag.all_nodes.get(task.task_name)
+        if node and task.map_index is not None:
+            map_node = node.parent_dag.parent_node
+            if map_node.status == TaskStatus.PENDING and map_node.running.get(task.map_index) == node.node_name:
+                node = node.for_map_item(task.map_index, map_node.items[task.map_index])
+            else:
+                node = None
+        elif node and node.status != TaskStatus.QUEUED:
+            node = None
+
+        if not node:
+            # i.e. the run was resumed in the meantime. The slot is given to the next launch in the queue instead.
+            print(f"This launch is not queued anymore: {task.task_name}")
+            self._launch_limiter.remove(task.entry)
+            self._dequeued.extend(self._launch_limiter.dequeue([task.key]))
+            return []
+
+        node.set_enqueued(task.enqueued)
+        node.set_queue_entry(task.entry)
+        return [node]
+
+    def _process_resume(self, dag):
+        if not dag.orchestration_status.get_task_status(dag.start_node.node_name):
+            print(f"There is no saved status to resume the run: {dag.orchestration_status.run_id}")
+            return []
+
+        frontier = self._get_frontier(dag)
+        if not frontier:
+            print(f"All the nodes are already completed in the run: {dag.orchestration_status.run_id}")
+
+        superseded = []
+        for node in frontier:
+            if node.node_type == NodeTypes.TASK:
+                if node.status == TaskStatus.PENDING:
+                    superseded.append(node)
+                # The resumed Tasks start over, including their retries (see Task.retry_attempts).
+                node.set_status(TaskStatus.NEW)
+                node.set_resumed_at(node.attempts)
+                node.set_error(None)
+                dag.orchestration_status.update_task_status(node)
+            elif node.node_type == NodeTypes.MAP and node.resolved:
+                # The running items of the Map Node are relaunched as well.
+                superseded.extend(node.iterator.nodes.values())
+
+        self._clear_superseded(dag, superseded)
+        return frontier
+
+    def _clear_superseded(self, dag, nodes):
+        # The executions that are still running for the resumed Tasks are replaced by new ones, so they don't keep
+        # their slots and their in-flight markers (i.e. for the TaskWatchdog). Their completion events are ignored.
+        run_id = dag.orchestration_status.run_id
+        node_names = {node.node_name for node in nodes}
+        for target_type in {node.target_type.value for node in nodes}:
+            for in_flight in dag.exec_status.list_in_flight(target_type):
+                if in_flight.get('run_id') != run_id or in_flight.get('node_name') not in node_names:
+                    continue
+                print(f"Superseded execution: {in_flight['execution_id']} ({in_flight['node_name']})")
+                execution = dag.exec_status.get_execution(in_flight['execution_id'])
+                self._release_slots(execution.get('slots'))
+                dag.exec_status.clear_in_flight(target_type, in_flight['execution_id'])
+
+    def _get_frontier(self, dag):
+        # Returns the first Node that is not done in the DAG, or the ones in its branches if it was already started.
+        orchestration_status = dag.orchestration_status
+        node = dag.start_node
+        while node:
+            if not node.status.is_done:
+                # A Map Node resumes its own running items, and a Condition that wasn't evaluated (i.e. its callable
+                # raised) is evaluated again (see _expand).
+                if not node.branches or node.status == TaskStatus.NEW or node.node_type == NodeTypes.MAP \
+                        or (node.node_type == NodeTypes.CONDITION and not self._is_evaluated(node)):
+                    return [node]
+
+                frontier = [frontier_node for branch in node.branches for frontier_node in self._get_frontier(branch)]
+                # A Node can have all its branches done if the run stopped right before the join.
+                node.set_status(TaskStatus.PENDING if frontier else TaskStatus.COMPLETED)
+                orchestration_status.update_task_status(node)
+                if frontier:
+                    return frontier
+
+            node = None if node.is_end else node.next
+        return []
+
+    @staticmethod
+    def _is_evaluated(condition):
+        # The branches of an evaluated Condition are either skipped or started.
+        return any(branch.start_node.status != TaskStatus.NEW for branch in condition.branches)
+
+    def _get_previous_task(self, node):
+        # Returns the Task whose response a Condition or a Map Node gets, i.e. to evaluate them again on a resume.
+        while node:
+            dag = node.parent_dag
+            if node is dag.start_node:
+                # The first Node of a branch gets the response before its parent Node.
+                node = dag.parent_node
+                continue
+
+            previous = next((n for n in dag.nodes.values() if n.next is node), None)
+            if previous and previous.node_type == NodeTypes.CONDITION and not self._get_chosen_branches(previous):
+                # A Condition that didn't choose any branch passes on the response before it.
+                node = previous
+                continue
+            return self._get_last_task(previous) if previous else None
+        return None
+
+    @staticmethod
+    def _get_chosen_branches(node):
+        return [branch for branch in node.branches if branch.start_node.status != TaskStatus.SKIPPED]
+
+    def _get_last_task(self, node):
+        # Returns the Node itself if it's a Task, or the last Task of the chosen branch of a Condition (or of the
+        # workflow of a SubWorkflow). There is no single last Task in a Parallel or a Map Node.
+        if node.node_type == NodeTypes.TASK:
+            return node
+        if node.node_type in (NodeTypes.CONDITION, NodeTypes.SUB_WORKFLOW):
+            for branch in self._get_chosen_branches(node):
+                end_node = next((n for n in branch.nodes.values() if n.is_end), None)
+                return self._get_last_task(end_node) if end_node else None
+        return None
+
+    def _get_previous_response(self, node):
+        # The response is only read if the Node needs it (see _expand).
+        def get_response():
+            previous = self._get_previous_task(node)
+            if not previous or not previous.execution_id:
+                return None
+            exec_status = node.parent_dag.exec_status
+            return exec_status.get_response(exec_status.get_execution(previous.execution_id))
+        return functools.lru_cache()(get_response)
+
+    def _expand(self, nodes, get_response, parameters):
+        # Replaces the Nodes that are resolved inside the orchestrator (i.e. Parallel and Condition) by the Tasks that
+        # should be launched for them, so the Conditions don't need a round trip through a Task. The response of the
+        # previous Task is only read (with get_response) if a Condition or a Map Node needs it.
+        tasks = []
+        nodes = list(nodes)
+        while nodes:
+            node = nodes.pop(0)
+            orchestration_status = node.parent_dag.orchestration_status
+
+            if node.node_type == NodeTypes.PARALLEL:
+                node.set_status(TaskStatus.PENDING)
+                orchestration_status.update_task_status(node)
+                nodes.extend(branch.start_node for branch in node.branches)
+
+            elif node.node_type == NodeTypes.CONDITION:
+                try:
+                    chosen_branch = node.choose(get_response(), parameters)
+                except Exception as e:
+                    print(f"Error in evaluating the Condition: {node.node_name} --> {e}")
+                    traceback.print_exc()
+                    node.set_status(TaskStatus.FAILED)
+                    orchestration_status.update_task_status(node)
+                    self._fail_parents(node)
+                    continue
+
+                for branch in node.branches:
+                    if branch is not chosen_branch:
+                        self._skip(branch)
+
+                if chosen_branch:
+                    print(f"Condition {node.node_name} chose: {chosen_branch.start_node.node_name}")
+                    node.set_status(TaskStatus.PENDING)
+                    nodes.append(chosen_branch.start_node)
+                else:
+                    # None of the branches was chosen, so we can directly move on to the next of the Condition.
+                    print(f"Condition {node.node_name} didn't choose any branch.")
+                    node.set_status(TaskStatus.COMPLETED)
+                    nodes.extend(self._get_successors(node))
+                orchestration_status.update_task_status(node)
+
+            elif node.node_type == NodeTypes.MAP:
+                # A Map Node whose items were not resolved (i.e. its callable raised) resolves them again on a resume.
+                if not node.resolved:
+                    try:
+                        node.resolve_items(get_response(), parameters)
+                    except Exception as e:
+                        print(f"Error in resolving the items of the Map: {node.node_name} --> {e}")
+                        traceback.print_exc()
+                        node.set_status(TaskStatus.FAILED)
+                        orchestration_status.update_task_status(node)
+                        self._fail_parents(node)
+                        continue
+                    print(f"Map {node.node_name} has {len(node.items)} items.")
+                else:
+                    # The Map Node was resumed, so its running items (including the failed ones) are relaunched.
+                    node.reset_failures()
+                    tasks.extend(
+                        node.iterator.nodes[node_name].for_map_item(index, node.items[index])
+                        for index, node_name in node.running.items()
+                    )
+
+                node.set_status(TaskStatus.PENDING)
+                tasks.extend(self._launch_map_items(node))
+                if node.all_items_completed:
+                    # There are no items at all.
+                    node.set_status(TaskStatus.COMPLETED)
+                    nodes.extend(self._get_successors(node))
+                orchestration_status.update_task_status(node)
+
+            elif node.node_type == NodeTypes.SUB_WORKFLOW:
+                if not node.workflow:
+                    try:
+                        self._expand_sub_workflow(node)
+                    except Exception as e:
+                        print(f"Error in building the workflow of: {node.node_name} --> {e}")
+                        traceback.print_exc()
+                        node.set_status(TaskStatus.FAILED)
+                        orchestration_status.update_task_status(node)
+                        self._fail_parents(node)
+                        continue
+
+                print(f"SubWorkflow {node.node_name} starts: {node.workflow_name}")
+                node.set_status(TaskStatus.PENDING)
+                orchestration_status.update_task_status(node)
+                nodes.append(node.workflow.start_node)
+
+            else:
+                tasks.append(node)
+
+        return tasks
+
+    def _expand_sub_workflow(self, node):
+        # The workflow is built only when the run reaches it, so the events of the run only build the active part of
+        # the DAG (see DAGBuilder).
+        return DAGBuilder(dag=self._dag_definition, exec_status=node.parent_dag.exec_status,
+                          orchestration_status=node.parent_dag.orchestration_status).expand_sub_workflow(node)
+
+    def _skip(self, branch):
+        for node in branch.all_nodes.values():
+            node.set_status(TaskStatus.SKIPPED)
+            branch.orchestration_status.update_task_status(node)
+
+    def _get_successors(self, node):
+        # Returns the Nodes that should be triggered after the given Node is done.
+        if not node.is_end:
+            # If this Node was not the end node of the DAG, we can directly pick the next task to be executed.
+            return [node.next]
+
+        parent_node = node.parent_dag.parent_node
+        print(f"This is the end: {node.node_name}")
+
+        # If the immediate parent DAG of current Node doesn't have a parent node, that means it belongs to the
+        # root DAG (the most outer DAG). In this case, we don't need to trigger anything. Maybe we can decide to
+        # save some information or update the overall status of the orchestration here.
+        if not parent_node:
+            print(f"This is the real end!")
+            return []
+
+        if parent_node.node_type == NodeTypes.PARALLEL:
+            # If there is a parent Node for the current DAG, it means the Node that just finished is a
+            # part of a child DAG (i.e. a branch of a Parallel node).
+            # Then we need to check the statuses of the other branches to decide the next node.
+            all_done = True
+            failed = False
+            for branch in parent_node.branches:
+                statuses = [n.status for n in branch.nodes.values()]
+                if TaskStatus.FAILED in statuses:
+                    # A failed branch (that is out of retries) fails the Parallel Node as well.
+                    print(f"A task has failed in the DAG: {branch.start_node.node_name}")
+                    failed = True
+                    break
+                elif not all(status.is_done for status in statuses):
+                    # If branches have at least one incomplete Task, we don't need to do anything,
+                    # as the next can be determined eventually when those Tasks are completed.
+                    print(f"Still some tasks to get triggered of: {branch.start_node.node_name}")
+                    all_done = False
+                else:
+                    print(f"All steps are done in the DAG: {branch.start_node.node_name}")
+
+            # If all the Tasks are completed in all the branches, we need to pick the next Node as the next of
+            # the parent Node (which is defined as the next of the Parallel Node in this case).
+            # Else, we don't need to do anything at the moment.
+            if failed or not all_done:
+                parent_node.set_status(TaskStatus.FAILED if failed else TaskStatus.PENDING)
+                parent_node.parent_dag.orchestration_status.update_task_status(parent_node)
+                return []
+
+        elif parent_node.node_type not in (NodeTypes.CONDITION, NodeTypes.SUB_WORKFLOW):
+            # The type of the parent Node is not implemented yet! This is just a fail-safe for now.
+            print(f"Not implemented! :{parent_node.to_json()}")
+            return []
+
+        # The only branch of a Condition that runs is the chosen one (and a SubWorkflow has only one), so the parent
+        # Node is done with it.
+        parent_node.set_status(TaskStatus.COMPLETED)
+        parent_node.parent_dag.orchestration_status.update_task_status(parent_node)
+        return self._get_successors(parent_node)
+
+    def _process_event(self, task, dag):
+        # Applies the event to the DAG of its run, and returns the Tasks that should be launched next (if any).
+        # This doesn't persist anything, so the callers can decide when to save the Orchestration Status.
+        if isinstance(task, DataflowEvent) and task.needs_job_state:
+            self._resolve_job_state(task)
+            if not task.is_terminal:
+                # The state of the job is not updated yet, so the DataflowJobPoller will report it instead.
+                print(f"The Dataflow job is not finished yet: {task.execution_id}")
+                return []
+
+        next_nodes = self._get_next_nodes(task, dag)
+        if task.target_type == TargetTypes.RESUME:
+            # The resumed Nodes are on different paths, so each of them gets the response of the Task before it.
+            return [
+                next_task
+                for node in next_nodes
+                for next_task in self._expand([node], self._get_previous_response(node),
+                                              dag.orchestration_status.run_parameters)
+            ]
+
+        get_response = functools.lru_cache()(lambda: dag.exec_status.get_response(task.execution))
+        return self._expand(next_nodes, get_response, dag.orchestration_status.run_parameters)
+
+    def _resolve_job_state(self, task):
+        # The location of the job is taken from its execution, as the log line only has the project number.
+        execution = task.execution or {}
+        job = DataflowJobPoller(self._exec_status).get_job(
+            execution.get('project_id', task.project_id), execution.get('region', task.region), task.execution_id
+        )
+        print(f"State of the Dataflow job: {task.execution_id} ({job.get('currentState')})")
+        task.set_job_state(job.get('currentState'))
+
+    def _get_next_nodes(self, task, dag):
+        orchestration_status = dag.orchestration_status
+        all_tasks = dag.all_tasks
 
         if task.target_type == TargetTypes.START:
             # Save all the Nodes if this is the first execution of the orchestration.
-            next_node = dag.start_node
             initial_status = {
                 node_name: node.to_json()
                 for node_name, node in dag.all_nodes.items()
             }
-            self._orchestration_status.set_initial_status(initial_status)
-        else:
-            node = all_tasks.get(task.task_name)
-            if not node:
-                print(f"This task is not tracked: {task.task_name}")
-                return
-
-            node.set_status(task.status)
-            # Update the current status of the completed Task,
-            # so we can determine the overall status of the orchestration.
-            self._orchestration_status.update_task_status(node)
-
-            parent_dag = node.parent_dag
-
-            # Every Node MUST have a parent DAG. This is just a safety check.
-            if not parent_dag:
-                print(f"Something is wrong! A Node should have a parent DAG. But none found for: {node.node_name}")
-                return
-
-            parent_node = parent_dag.parent_node
-            print(f"Parent node {parent_node}")
-
-            if node.is_end:
-                print(f"This is the end: {task.task_name}")
-                parent_dag = node.parent_dag
-                parent_node = parent_dag.parent_node
-
-                # If the immediate parent DAG of current Node doesn't have a parent node, that means it belongs to the
-                # root DAG (the most outer DAG). In this case, we don't need to trigger anything. Maybe we can decide to
-                # save some information or update the overall status of the orchestration here.
-                if not parent_node:
-                    print(f"This is the real end!")
-                elif parent_node.node_type == NodeTypes.PARALLEL:
-                    # If there is a parent Node for the current DAG, it means the Node that just finished is a
-                    # part of a child DAG (i.e. a branch of a Parallel node).
-                    # Then we need to check the statuses of the other branches to decide the next node.
-                    all_done = True
-                    for branch in parent_node.branches:
-                        # TODO: Handle failed tasks
-                        statuses = {
-                            node_name: n.status == TaskStatus.COMPLETED for node_name, n in branch.nodes.items()
-                        }
-                        if False in statuses.values():
-                            # If branches have at least one incomplete Task, we don't need to do anything,
-                            # as the next can be determined eventually when those Tasks are completed.
-                            print(f"Still some tasks to get triggered of: {branch.start_node.node_name}")
-                            all_done = False
-                            break
-                        else:
-                            print(f"All steps are done in the DAG: {branch.start_node.node_name}")
-
-                    # If all the Tasks are completed in all the branches, we need to pick the next Node as the next of
-                    # the parent Node (which is defined as the next of the Parallel Node in this case).
-                    # Else, we don't need to do anything at the moment.
-                    if all_done:
-                        parent_node.set_status(TaskStatus.COMPLETED)
-                        next_node = parent_node.next
-                    else:
-                        parent_node.set_status(TaskStatus.PENDING)
-                        next_node = None
-                else:
-                    # The type of the parent Node is not implemented yet! This is just a fail-safe for now.
-                    print(f"Not implemented! :{parent_node.to_json()}")
-            else:
-                # If this Node was not the end node of the DAG, we can directly pick the next task to be executed.
-                next_node = node.next
+            orchestration_status.set_initial_status(initial_status)
+            orchestration_status.set_run_parameters(task.parameters)
+            orchestration_status.set_run_priority(task.priority)
+            return [dag.start_node]
 
-        # Now we should save the current state of the orchestration.
-        # We have this statement here, in case there is no next node, but we still will save the status.
-        self._orchestration_status.save_orchestration_status()
+        if task.target_type == TargetTypes.RESUME:
+            return self._process_resume(dag)
 
-        if not next_node:
-            print(f"No next node found.")
-            return
+        if task.target_type == TargetTypes.RETRY:
+            return self._process_retry(task, dag)
+
+        if task.target_type == TargetTypes.DEQUEUE:
+            return self._process_dequeue(task, dag)
+
+        # The Node is found with the saved execution if possible, as several Nodes (i.e. the items of a Map Node) can
+        # have the same target.
+        execution = task.execution or {}
+        node = dag.all_nodes.get(execution['node_name']) if 'node_name' in execution else all_tasks.get(task.task_name)
+        if not node:
+            print(f"This task is not tracked: {task.task_name}")
+            return []
+
+        if 'map_index' in execution:
+            return self._process_map_item(node, execution['map_index'], task.status, execution,
+                                          timed_out=isinstance(task, TaskTimeout))
+
+        # The execution is over even if the event is ignored below, so it doesn't keep its slots or its in-flight
+        # marker (i.e. a late attempt would be reported by the TaskWatchdog forever).
+        dag.exec_status.clear_in_flight(node.target_type.value, execution.get('execution_id', task.execution_id))
+        self._release_slots(execution.get('slots'))
+
+        if node.status != TaskStatus.PENDING or execution.get('attempt', node.attempts) != node.attempts:
+            # Duplicate or late events (i.e. a Dataflow job reported by both its logs and the DataflowJobPoller, or
+            # a timed out attempt that finishes after it was retried) are ignored, so they don't trigger the next
+            # Nodes twice.
+            print(f"This task is not running: {task.task_name} ({node.status.value})")
+            return []
+
+        if isinstance(task, TaskTimeout):
+            self._cancel_timed_out(node, execution)
+
+        node.set_status(task.status)
+        if task.status == TaskStatus.FAILED:
+            node.set_error(task.error or RetryPolicy.TASK_FAILED)
+
+        # Update the current status of the completed Task,
+        # so we can determine the overall status of the orchestration.
+        orchestration_status.update_task_status(node)
+
+        if node.status == TaskStatus.COMPLETED:
+            self._save_result(execution)
+            self._record_output(node, execution)
 
-        print(f"Next node: {next_node.node_name}")
+        if node.status == TaskStatus.FAILED:
+            self._handle_failure(node)
+            return []
 
-        # Now we execute the selected next Node.
-        next_node.execute()
+        # Every Node MUST have a parent DAG. This is just a safety check.
+        if not node.parent_dag:
+            print(f"Something is wrong! A Node should have a parent DAG. But none found for: {node.node_name}")
+            return []
 
-        # Then we save the orchestration status again with the new state of the executed Task.
-        self._orchestration_status.save_orchestration_status()
+        return self._get_successors(node)
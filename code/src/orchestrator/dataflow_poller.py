@@ -0,0 +1,63 @@
+import traceback
+
+from .enums import TargetTypes
+from .events import DataflowEvent
+
+
+class DataflowJobPoller:
+    # Detects the completion of the in-flight Dataflow jobs of all the runs, as a fallback for the log lines.
+    # Instead of checking every job separately, it lists the active jobs once per project and region, and only looks
+    # up the in-flight jobs that are not active anymore.
+
+    def __init__(self, exec_status):
+        self._exec_status = exec_status
+        self._dataflow = None
+
+    def _get_dataflow(self):
+        if not self._dataflow:
+            from googleapiclient.discovery import build
+            from oauth2client.client import GoogleCredentials
+
+            credentials = GoogleCredentials.get_application_default()
+            self._dataflow = build('dataflow', 'v1b3', credentials=credentials, cache_discovery=False)
+        return self._dataflow
+
+    def poll(self):
+        # Returns the events of the in-flight jobs that reached a terminal state.
+        locations = dict()
+        for execution in self._exec_status.list_in_flight(TargetTypes.DATAFLOW_JOB.value):
+            location = (execution.get('project_id'), execution.get('region'))
+            locations.setdefault(location, []).append(execution)
+
+        events = []
+        for (project_id, region), executions in locations.items():
+            try:
+                active_job_ids = self._list_active_job_ids(project_id, region)
+                for execution in executions:
+                    if execution['execution_id'] in active_job_ids:
+                        continue
+
+                    job = self.get_job(project_id, region, execution['execution_id'])
+                    if job.get('currentState') in DataflowEvent.TERMINAL_STATES:
+                        print(f"Dataflow job finished without a log event: {job['name']} ({job['currentState']})")
+                        events.append(DataflowEvent.event_data_from_job(job))
+            except Exception as e:
+                print(f"Error in polling Dataflow jobs in {project_id}/{region} --> {e}")
+                traceback.print_exc()
+
+        return events
+
+    def get_job(self, project_id, region, job_id):
+        return self._get_dataflow().projects().locations().jobs().get(
+            projectId=project_id, location=region, jobId=job_id
+        ).execute()
+
+    def _list_active_job_ids(self, project_id, region):
+        jobs = self._get_dataflow().projects().locations().jobs()
+        job_ids = set()
+        request = jobs.list(projectId=project_id, location=region, filter='ACTIVE', view='JOB_VIEW_SUMMARY')
+        while request is not None:
+            response = request.execute()
+            job_ids.update(job['id'] for job in response.get('jobs', []))
+            request = jobs.list_next(previous_request=request, previous_response=response)
+        return job_ids
@@ -16,15 +16,32 @@ class NodeTypes(Enum, metaclass=EnumTypesMeta):
     PARALLEL = 'Parallel'
     END = 'End'
     CONDITION = 'Condition'
+    MAP = 'Map'
+    SUB_WORKFLOW = 'SubWorkflow'
 
 
 class TargetTypes(Enum, metaclass=EnumTypesMeta):
     START = 'Start'
+    RESUME = 'Resume'
+    RETRY = 'Retry'
+    DEQUEUE = 'Dequeue'
     FUNCTION = 'Function'
     CLOUD_FUNCTION = 'CloudFunction'
     DATAFLOW_JOB = 'Dataflow'
 
 
+class LaunchModes(Enum, metaclass=EnumTypesMeta):
+    # SYNC waits until the target finishes, and ASYNC only until the launch request is accepted.
+    SYNC = 'sync'
+    ASYNC = 'async'
+
+
+class PoolTypes(Enum, metaclass=EnumTypesMeta):
+    # Where the in-process Functions are executed.
+    THREAD = 'thread'
+    PROCESS = 'process'
+
+
 class DataflowTemplateType(Enum, metaclass=EnumTypesMeta):
     FLEX = 'Flex'
     CLASSIC = 'Classic'
@@ -35,3 +52,19 @@ class TaskStatus(Enum, metaclass=EnumTypesMeta):
     PENDING = 'Running'
     COMPLETED = 'Completed'
     FAILED = 'Failed'
+    RETRYING = 'Retrying'
+    SKIPPED = 'Skipped'
+    # Waiting in the launch queue for a slot (see LaunchLimiter).
+    QUEUED = 'Queued'
+
+    @property
+    def is_done(self):
+        # Skipped Nodes (i.e. the branches of a Condition that were not chosen) count as done for the joins.
+        return self in (TaskStatus.COMPLETED, TaskStatus.SKIPPED)
+
+
+class ScheduledEvents(Enum, metaclass=EnumTypesMeta):
+    # Special events that are sent periodically (i.e. by Cloud Scheduler) instead of by a Task.
+    DATAFLOW_POLL = 'dataflow_poll'
+    RETRY_POLL = 'retry_poll'
+    WATCHDOG = 'watchdog'
@@ -1,6 +1,8 @@
+import re
 import time
+import uuid
 from typing import Union
-from .enums import TargetTypes, TaskStatus
+from .enums import TargetTypes, TaskStatus, ScheduledEvents
 
 
 class Event:
@@ -12,6 +14,9 @@ class Event:
         self._execution_id = kwargs.get('execution_id')
         self._run_id = kwargs.get('run_id')
         self._status = TaskStatus.NEW
+        self._execution = None
+        self._trace_id = None
+        self._error = None
 
     @property
     def task_name(self):
@@ -33,9 +38,26 @@ class Event:
     def status(self):
         return self._status
 
+    @property
+    def trace_id(self):
+        return self._trace_id
+
+    @property
+    def error(self):
+        # The error class of a failed Task, if the event knows better than the generic TaskFailed.
+        return self._error
+
+    @property
+    def execution(self):
+        # The saved execution of the Task that sent this event (if any).
+        return self._execution
+
     def set_run_id(self, run_id):
         self._run_id = run_id
 
+    def set_execution(self, execution):
+        self._execution = execution
+
     def set_status(self, status: TaskStatus):
         self._status = status
 
@@ -45,7 +67,130 @@ class Start(Event):
         super(Start, self).__init__(**kwargs)
         self._task_name = 'start'
         self._target_type = TargetTypes.START
-        self._run_id = f"run_{int(time.time())}"
+        # The random suffix keeps the runs that start in the same second apart.
+        self._run_id = f"run_{int(time.time())}_{uuid.uuid4().hex[:8]}"
+        # Parameters of the run can be passed with the start message, as well as the priority of its queued launches:
+        # {"resource": {"type": "start"}, "parameters": {"date": "2021-12-12"}, "priority": 10}
+        self._parameters = self._event_data.get('parameters', {}) if self._event_data else {}
+        self._priority = self._event_data.get('priority', 0) if self._event_data else 0
+
+    @property
+    def parameters(self):
+        return self._parameters
+
+    @property
+    def priority(self):
+        return self._priority
+
+
+class Resume(Event):
+    # Restarts an existing run from the Nodes that are not completed yet: {"resource": {"type": "resume",
+    # "labels": {"run_id": "run_1639322384_5f3c2a1d"}}}
+    def __init__(self, **kwargs):
+        super(Resume, self).__init__(**kwargs)
+        self._task_name = 'resume'
+        self._target_type = TargetTypes.RESUME
+        self._run_id = self._event_data['resource']['labels']['run_id']
+
+
+class Retry(Event):
+    # Re-launches a failed Task, once its retry is due.
+    def __init__(self, **kwargs):
+        super(Retry, self).__init__(**kwargs)
+        labels = self._event_data['resource']['labels']
+        self._task_name = labels['node_name']
+        self._run_id = labels['run_id']
+        self._attempts = labels['attempts']
+        self._due = labels['due']
+        self._target_type = TargetTypes.RETRY
+
+    @property
+    def attempts(self):
+        return self._attempts
+
+    @property
+    def due(self):
+        return self._due
+
+    @staticmethod
+    def event_data(run_id, node_name, attempts, due):
+        return {
+            "resource": {
+                "type": "retry",
+                "labels": {"run_id": run_id, "node_name": node_name, "attempts": attempts, "due": due}
+            }
+        }
+
+
+class Dequeue(Event):
+    # Launches a Task that was waiting in the launch queue, once a slot of the limit it reached is released.
+    def __init__(self, **kwargs):
+        super(Dequeue, self).__init__(**kwargs)
+        labels = self._event_data['resource']['labels']
+        self._task_name = labels['node_name']
+        self._run_id = labels['run_id']
+        self._map_index = labels.get('map_index')
+        self._key = labels['key']
+        self._priority = labels.get('priority', 0)
+        self._enqueued = labels.get('enqueued')
+        # The object of the launch in the queue, which is only removed once the Task is launched (or queued again).
+        self._entry = labels.get('entry')
+        self._target_type = TargetTypes.DEQUEUE
+
+    @property
+    def map_index(self):
+        return self._map_index
+
+    @property
+    def key(self):
+        return self._key
+
+    @property
+    def priority(self):
+        return self._priority
+
+    @property
+    def enqueued(self):
+        return self._enqueued
+
+    @property
+    def entry(self):
+        return self._entry
+
+    @staticmethod
+    def event_data(key, run_id, node_name, map_index=None, priority=0, enqueued=None, entry=None):
+        return {
+            "resource": {
+                "type": "dequeue",
+                "labels": {
+                    "key": key, "run_id": run_id, "node_name": node_name, "map_index": map_index,
+                    "priority": priority, "enqueued": enqueued, "entry": entry
+                }
+            }
+        }
+
+
+class TaskTimeout(Event):
+    # Fails an execution that is past its deadline (see TaskWatchdog), as if it had reported its failure itself.
+    ERROR = 'TaskTimedOut'
+
+    def __init__(self, **kwargs):
+        super(TaskTimeout, self).__init__(**kwargs)
+        labels = self._event_data['resource']['labels']
+        self._task_name = labels.get('node_name')
+        self._execution_id = labels['execution_id']
+        self._target_type = TargetTypes(labels['target_type'])
+        self._status = TaskStatus.FAILED
+        self._error = self.ERROR
+
+    @staticmethod
+    def event_data(execution_id, target_type, node_name=None):
+        return {
+            "resource": {
+                "type": "task_timeout",
+                "labels": {"execution_id": execution_id, "target_type": target_type, "node_name": node_name}
+            }
+        }
 
 
 class DataflowEvent(Event):
@@ -76,17 +221,84 @@ class DataflowEvent(Event):
         }
     """
 
+    # Terminal messages of a Dataflow job, and the status of the Task they imply. Any other log line of the job
+    # is not relevant for the orchestration. The workers of a failed job are stopped as well, and the log lines are
+    # not ordered, so the status of a job whose worker pool stopped is taken from its state (see needs_job_state).
+    TERMINAL_MESSAGES = [
+        ("Worker pool stopped.", None),
+        ("Workflow failed.", TaskStatus.FAILED),
+        ("Error occurred in the launcher container: Template launch failed.", TaskStatus.FAILED),
+        ("Cancel request is committed for workflow job", TaskStatus.FAILED),
+    ]
+
+    # Terminal states of a Dataflow job as returned by the Dataflow API (i.e. by the DataflowJobPoller).
+    TERMINAL_STATES = {
+        'JOB_STATE_DONE': TaskStatus.COMPLETED,
+        'JOB_STATE_DRAINED': TaskStatus.COMPLETED,
+        'JOB_STATE_FAILED': TaskStatus.FAILED,
+        'JOB_STATE_CANCELLED': TaskStatus.FAILED,
+    }
+
     def __init__(self, **kwargs):
         super(DataflowEvent, self).__init__(**kwargs)
         event_data = self._event_data
-        # TODO: Call the Dataflow API and extract the correct status
-        self._status = TaskStatus.COMPLETED
+        self._project_id = None
+        self._region = None
         if event_data:
             self._task_name = event_data['resource']['labels']['job_name']
             self._execution_id = event_data['resource']['labels']['job_id']
+            self._project_id = event_data['resource']['labels'].get('project_id')
+            self._region = event_data['resource']['labels'].get('region')
+            self._status = self._extract_status(event_data)
         self._target_type = TargetTypes.DATAFLOW_JOB
         self._job_type = None
 
+    @property
+    def project_id(self):
+        return self._project_id
+
+    @property
+    def region(self):
+        return self._region
+
+    @property
+    def is_terminal(self):
+        return self._status in (TaskStatus.COMPLETED, TaskStatus.FAILED)
+
+    @property
+    def needs_job_state(self):
+        # The message is terminal, but it doesn't tell whether the job succeeded.
+        return self._event_data is not None and self._status is None
+
+    def set_job_state(self, job_state):
+        self._status = self.TERMINAL_STATES.get(job_state, TaskStatus.PENDING)
+
+    def _extract_status(self, event_data):
+        if 'job_state' in event_data:
+            return self.TERMINAL_STATES.get(event_data['job_state'], TaskStatus.PENDING)
+
+        text_payload = event_data.get('textPayload', '')
+        for message, status in self.TERMINAL_MESSAGES:
+            if text_payload.startswith(message):
+                return status
+        return TaskStatus.PENDING
+
+    @staticmethod
+    def event_data_from_job(job: dict) -> dict:
+        # Creates an event in the same shape as a log line of the job, using a job returned by the Dataflow API.
+        return {
+            "resource": {
+                "type": "dataflow_step",
+                "labels": {
+                    "region": job.get('location'),
+                    "project_id": job.get('projectId'),
+                    "job_name": job['name'],
+                    "job_id": job['id']
+                }
+            },
+            "job_state": job['currentState']
+        }
+
 
 class CloudFunctionEvent(Event):
     """
@@ -112,27 +324,56 @@ class CloudFunctionEvent(Event):
         }
     """
 
+    # i.e. "Function execution took 426 ms, finished with status code: 200"
+    # or "Function execution took 60003 ms, finished with status: 'timeout'"
+    STATUS_CODE_PATTERN = re.compile(r"finished with status code: (\d+)")
+
     def __init__(self, **kwargs):
         super(CloudFunctionEvent, self).__init__(**kwargs)
         event_data = self._event_data
-        # TODO: Call the CloudFunctions API and extract the correct status
         self._status = TaskStatus.COMPLETED
         if event_data:
             self._task_name = event_data['resource']['labels']['function_name']
             self._execution_id = event_data['labels']['execution_id']
+            self._status = self._extract_status(event_data.get('textPayload', ''))
+            # i.e. "projects/trv-hs-src-consolidation-test/traces/4f1fa5e834247f28382e1ae2d571ad7d"
+            if event_data.get('trace'):
+                self._trace_id = event_data['trace'].split('/')[-1]
         self._target_type = TargetTypes.CLOUD_FUNCTION
 
+    def _extract_status(self, text_payload):
+        match = self.STATUS_CODE_PATTERN.search(text_payload)
+        if match:
+            return TaskStatus.COMPLETED if int(match.group(1)) < 400 else TaskStatus.FAILED
+        # The other endings (i.e. 'crash', 'timeout', 'connection error') don't have a status code.
+        return TaskStatus.FAILED if 'finished with status:' in text_payload else TaskStatus.COMPLETED
+
 
 class EventsFactory:
+    @staticmethod
+    def get_scheduled_event(event_data: dict) -> Union[ScheduledEvents, None]:
+        resource_type = event_data['resource']['type']
+        return ScheduledEvents(resource_type) if resource_type in ScheduledEvents else None
+
     @staticmethod
     def create_from_event(event_data: dict) -> Union[Event, None]:
         resource_type = event_data['resource']['type']
         if resource_type == 'dataflow_step':
-            return DataflowEvent(event_data=event_data)
+            event = DataflowEvent(event_data=event_data)
+            # Only the terminal messages of a job are relevant for the orchestration.
+            return event if event.is_terminal or event.needs_job_state else None
         elif resource_type == 'cloud_function':
             return CloudFunctionEvent(event_data=event_data)
         elif resource_type == 'start':
             return Start(event_data=event_data)
+        elif resource_type == 'resume':
+            return Resume(event_data=event_data)
+        elif resource_type == 'retry':
+            return Retry(event_data=event_data)
+        elif resource_type == 'dequeue':
+            return Dequeue(event_data=event_data)
+        elif resource_type == 'task_timeout':
+            return TaskTimeout(event_data=event_data)
         else:
             return None
 
@@ -0,0 +1,78 @@
+from .status import SlotStatus, LaunchQueueStatus
+from .events import Dequeue
+
+
+class LaunchLimiter:
+    # Limits the concurrent executions of target types and targets across all the runs, with launch slots that are
+    # shared in the status bucket. The limits are keyed by the target type, or by the target type and the target name:
+    # {"Dataflow": 20, "CloudFunction/heavy-function": 5}
+    # A launch over a limit waits in the launch queue of that limit, and it's launched again (with a Dequeue event)
+    # when a slot of the same limit is released.
+
+    def __init__(self, bucket, limits=None):
+        self._limits = limits or dict()
+        self._slots = SlotStatus(bucket)
+        self._queue = LaunchQueueStatus(bucket)
+
+    def get_keys(self, node):
+        keys = [node.target_type.value, f"{node.target_type.value}/{node.target_name}"]
+        return [key for key in keys if key in self._limits]
+
+    def acquire(self, node, run_id):
+        # Returns the slots that were taken for the Task, and the key of the limit that was reached (if any). The
+        # Task gets either all of its slots or none of them. A new launch doesn't take a slot while other launches are
+        # waiting in the queue of the same limit, so it doesn't get ahead of them (i.e. of the runs with a higher
+        # priority).
+        keys = self.get_keys(node)
+        if node.queue_entry is None:
+            for key in keys:
+                if self._queue.has_launches(key):
+                    return None, key
+
+        slots = []
+        holder = {'run_id': run_id, 'node_name': node.node_name, 'map_index': node.map_index}
+        for key in keys:
+            slot = self._slots.acquire(key, self._limits[key], holder)
+            if not slot:
+                self.release(slots)
+                return None, key
+            slots.append(slot)
+        return slots, None
+
+    def release(self, slots):
+        # Returns the keys of the released slots, except the ones that were already released.
+        return [key for key in (self._slots.release(slot) for slot in slots or []) if key]
+
+    def enqueue(self, key, run_id, node, priority=0, enqueued=None):
+        # A launch that was taken from the queue keeps its place. Its entry is replaced only if it's queued for
+        # another limit now.
+        entry = self._queue.push(key, run_id, node.node_name, node.map_index, priority, enqueued)
+        if node.queue_entry != entry:
+            self.remove(node.queue_entry)
+
+    def remove(self, entry):
+        # Removes a launch from the queue once it was launched (or queued again).
+        if entry:
+            self._queue.remove(entry)
+
+    def dequeue(self, keys):
+        # Takes the next launch from the queue of each key, and returns them as Dequeue events. The launches stay in
+        # the queue until remove(), so the ones that are lost (i.e. by a crash) are taken again by dequeue_free().
+        events = []
+        for key in keys:
+            launch = self._queue.pop(key)
+            if launch:
+                events.append(Dequeue.event_data(**launch))
+        return events
+
+    def dequeue_free(self, keys=None):
+        # Fills the free slots of every limit (or of the given ones) from its queue. The released slots are normally
+        # refilled right away, but a launch can still be queued just after the last slot of its limit was released.
+        events = []
+        for key in keys or self._limits.keys():
+            for _ in range(self._limits[key] - self._slots.count(key)):
+                dequeued = self.dequeue([key])
+                if not dequeued:
+                    break
+                events.extend(dequeued)
+        return events
@@ -1,5 +1,6 @@
 from .enums import NodeTypes, TargetTypes
-from .nodes import Function, CloudFunctionTask, DataflowJob, Parallel
+from .nodes import Function, CloudFunctionTask, DataflowJob, Parallel, Condition, Map, SubWorkflow
+from .retry_policy import RetryPolicy
 
 
 class NodeFactory:
@@ -30,6 +31,10 @@ class NodeFactory:
                                     function=step.get('function'), parameters=step.get('parameters'),
                                     project_id=step.get('project_id'),
                                     parent_dag=parent_dag,
+                                    retry_policy=RetryPolicy.from_definition(step.get('retry')),
+                                    launch_mode=step.get('launch_mode'), launch_timeout=step.get('launch_timeout'),
+                                    timeout_seconds=step.get('timeout_seconds'), pool=step.get('pool'),
+                                    cache=step.get('cache'), output=step.get('output'),
                                     container_gcs_path=step.get('container_gcs_path'), region=step.get('region'))
             else:
                 raise Exception(f"Unsupported Task type: {target_type}")
@@ -37,6 +42,20 @@ class NodeFactory:
         elif step['type'] == NodeTypes.PARALLEL.value:
             node = Parallel(node_name=step['step_name'], parent_dag=parent_dag)
 
+        elif step['type'] == NodeTypes.CONDITION.value:
+            node = Condition(node_name=step['step_name'], parent_dag=parent_dag)
+
+        elif step['type'] == NodeTypes.MAP.value:
+            node = Map(node_name=step['step_name'], items=step['items'], max_concurrency=step.get('max_concurrency'),
+                       parent_dag=parent_dag)
+
+        elif step['type'] == NodeTypes.SUB_WORKFLOW.value:
+            node = SubWorkflow(node_name=step['step_name'], workflow=step['workflow'], parameters=step.get('parameters'),
+                               parent_dag=parent_dag)
+
+        else:
+            raise Exception(f"Unsupported Node type: {step['type']}")
+
         if step.get('end', False):
             node.set_as_end()
 
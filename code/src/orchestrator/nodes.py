@@ -1,8 +1,14 @@
 import os
+import copy
+import json
 import time
+import uuid
+import asyncio
 import traceback
+from concurrent.futures import ThreadPoolExecutor, ProcessPoolExecutor
 
-from .enums import NodeTypes, TargetTypes, DataflowTemplateType, TaskStatus
+from .enums import NodeTypes, TargetTypes, DataflowTemplateType, TaskStatus, LaunchModes, PoolTypes
+from .bindings import Bindings
 
 
 class Node:
@@ -33,6 +39,11 @@ class Node:
     def parent_dag(self):
         return self._parent_dag
 
+    @property
+    def branches(self):
+        # Child DAGs of the Node. Only the Nodes that contain other DAGs (i.e. Parallel) have them.
+        return []
+
     def set_next(self, next_node):
         self._next = next_node
 
@@ -43,6 +54,11 @@ class Node:
         print("Not implemented yet!")
         return None
 
+    async def execute_async(self, session=None):
+        # Nodes without a non-blocking launch run their blocking execute() on the default executor,
+        # so they don't stall the event loop of the orchestrator service.
+        return await asyncio.get_event_loop().run_in_executor(None, self.execute)
+
     def to_json(self):
         output = {
             'node_name': self.node_name,
@@ -56,6 +72,9 @@ class Node:
 
 
 class Task(Node):
+    # The status of a Task once it's launched successfully, i.e. it waits for its completion event.
+    LAUNCHED_STATUS = TaskStatus.PENDING
+
     def __init__(self, node_name: str, target_name: str, parameters: dict = None, function=None, *args, **kwargs):
         super(Task, self).__init__(node_name, *args, **kwargs)
         self._node_type = NodeTypes.TASK
@@ -64,6 +83,28 @@ class Task(Node):
         self._function = function
         self._target_type = None
         self._status = TaskStatus.NEW
+        self._retry_policy = kwargs.get('retry_policy')
+        self._attempts = 0
+        # The attempts before the last resume, which don't count for the retry policy anymore.
+        self._resumed_at = 0
+        # The last execution of the Task, so its response can be read again when the run is resumed.
+        self._execution_id = None
+        self._error = None
+        self._map_index = None
+        self._map_item = None
+        self._slots = []
+        self._enqueued = None
+        self._queue_entry = None
+        # The max runtime of an execution, after which the TaskWatchdog fails it.
+        self._timeout = kwargs.get('timeout_seconds')
+        # The settings of the ResultCache, if the results of the Task are cached: true, or {"inputs": [...], ...}
+        cache = kwargs.get('cache')
+        # The settings can be empty (i.e. for "cache": true), so a disabled cache is None.
+        self._cache = dict() if cache is True else None if cache is None or cache is False else cache
+        self._cache_key = None
+        # The reference to the output of the Task, which the next Steps can bind: "gs://..." or {"uri": "gs://..."}
+        output = kwargs.get('output')
+        self._output = {'uri': output} if isinstance(output, str) else output
 
     @property
     def target_name(self):
@@ -85,22 +126,267 @@ class Task(Node):
     def status(self):
         return self._status
 
+    @property
+    def retry_policy(self):
+        return self._retry_policy
+
+    @property
+    def attempts(self):
+        return self._attempts
+
+    @property
+    def error(self):
+        return self._error
+
     def set_status(self, status: TaskStatus):
         self._status = status
 
-    def to_json(self):
+    @property
+    def map_index(self):
+        return self._map_index
+
+    @property
+    def map_item(self):
+        return self._map_item
+
+    def set_attempts(self, attempts):
+        self._attempts = attempts
+
+    @property
+    def resumed_at(self):
+        return self._resumed_at
+
+    def set_resumed_at(self, resumed_at):
+        self._resumed_at = resumed_at
+
+    @property
+    def execution_id(self):
+        return self._execution_id
+
+    def set_execution_id(self, execution_id):
+        self._execution_id = execution_id
+
+    @property
+    def retry_attempts(self):
+        # The attempts that count for the retry policy. The attempts themselves keep increasing over the resumes, so
+        # the events of an older attempt are never taken for the current one.
+        return self._attempts - self._resumed_at
+
+    @property
+    def slots(self):
+        # The launch slots taken by the current execution (see LaunchLimiter).
+        return self._slots
+
+    def set_slots(self, slots):
+        self._slots = slots
+
+    @property
+    def cache(self):
+        return self._cache
+
+    @property
+    def cache_fields(self):
+        # What the result of the Task depends on (except its inputs), which is hashed into its cache key.
         return {
+            'target_type': self.target_type.value,
+            'target_name': self.target_name,
+            'parameters': self._get_parameters()
+        }
+
+    @property
+    def cache_key(self):
+        return self._cache_key
+
+    def set_cache_key(self, cache_key):
+        self._cache_key = cache_key
+
+    @property
+    def enqueued(self):
+        # When the Task was first put in the launch queue, so it keeps its place if it's queued again.
+        return self._enqueued
+
+    def set_enqueued(self, enqueued):
+        self._enqueued = enqueued
+
+    @property
+    def queue_entry(self):
+        # The object of the launch queue that this launch was taken from, if any (see LaunchLimiter).
+        return self._queue_entry
+
+    def set_queue_entry(self, queue_entry):
+        self._queue_entry = queue_entry
+
+    def for_map_item(self, index, item):
+        # Returns a copy of this Task for an item of its Map Node, so several items can be launched at the same time.
+        task = copy.copy(self)
+        task._map_index = index
+        task._map_item = item
+        return task
+
+    def _get_binding_context(self):
+        # The data of the run that the parameters and the output of the Task can refer to (see Bindings).
+        context = self.parent_dag.get_binding_context()
+        if self._map_index is not None:
+            context['index'] = self._map_index
+            context['item'] = self._map_item
+        return context
+
+    def get_output(self):
+        if not self._output:
+            return None
+        return Bindings.resolve(self._output, self._get_binding_context(), strict=False)
+
+    def _get_parameters(self):
+        # The parameters can refer to the data of the run, including the output of the Task itself.
+        context = self._get_binding_context()
+        if self._output:
+            context['output'] = Bindings.resolve(self._output, context, strict=False)
+        parameters = Bindings.resolve(self._parameters, context)
+
+        # The item of a Map Node is added to the parameters of the Task.
+        if self._map_index is None:
+            return parameters
+        item = self._map_item if isinstance(self._map_item, dict) else {'item': self._map_item}
+        return {**(parameters or {}), **item}
+
+    def set_error(self, error):
+        self._error = error
+
+    def launch(self):
+        # Launches the Task and returns its execution. The Task itself is only changed when the execution is
+        # recorded, so the orchestrator service can launch it without holding the lock of its DAGs.
+        raise NotImplementedError
+
+    async def launch_async(self, session=None):
+        # The Tasks without a non-blocking launch run their blocking launch() on the default executor.
+        return await asyncio.get_event_loop().run_in_executor(None, self.launch)
+
+    def execute(self):
+        return self.record_execution(self.launch())
+
+    async def execute_async(self, session=None):
+        return self.record_execution(await self.launch_async(session))
+
+    def record_execution(self, execution):
+        # Saves the execution against the current run, so the completion event can be traced back to it.
+        self._attempts += 1
+        if execution['succeeded']:
+            self._status = self.LAUNCHED_STATUS
+            self._error = None
+        else:
+            self._status = TaskStatus.FAILED
+            self._error = execution['error']
+
+        self._execution_id = execution['execution_id']
+        execution['run_id'] = self.parent_dag.orchestration_status.run_id
+        execution['target_type'] = self.target_type.value
+        execution['attempt'] = self._attempts
+        if self._map_index is not None:
+            execution['map_index'] = self._map_index
+        if self._slots:
+            execution['slots'] = self._slots
+        if self._cache_key:
+            execution['cache_key'] = self._cache_key
+        if self._output and execution['succeeded']:
+            execution['output'] = self.get_output()
+        if self._status == TaskStatus.PENDING and self._timeout:
+            execution['deadline'] = int(time.time() + self._timeout)
+
+        self.parent_dag.exec_status.save_execution(execution)
+        if self._status == TaskStatus.PENDING:
+            # Only the Tasks that are still running need to wait for a completion event.
+            self.parent_dag.exec_status.set_in_flight(execution)
+        if self._map_index is None:
+            # The items of a Map Node are tracked by the Map Node itself.
+            self.parent_dag.orchestration_status.update_task_status(self)
+        return execution, self
+
+    def to_json(self):
+        output = {
             **super().to_json(),
             'target_type': self.target_type.value,
             'target_name': self.target_name,
-            'status': self.status.value
+            'status': self.status.value,
+            'attempts': self.attempts
         }
 
+        if self.error:
+            output['error'] = self.error
+        if self.resumed_at:
+            output['resumed_at'] = self.resumed_at
+        if self.execution_id:
+            output['execution_id'] = self.execution_id
+
+        return output
+
 
 class Function(Task):
+    # Runs the Python callable of the Step ("function") inside the orchestrator, on a thread (or process) pool with a
+    # timeout. It's meant for lightweight steps, as it finishes within the launch itself: there is no completion event,
+    # and the next Nodes are triggered in the same invocation. The callable gets the parameters of the Task, and
+    # whatever it returns is saved as the response of the execution.
+    LAUNCHED_STATUS = TaskStatus.COMPLETED
+    _pools = dict()
+
     def __init__(self, *args, **kwargs):
         super(Function, self).__init__(*args, **kwargs)
         self._target_type = TargetTypes.FUNCTION
+        self._timeout = self._timeout or 60
+        self._pool_type = PoolTypes(kwargs.get('pool') or PoolTypes.THREAD.value)
+
+    @classmethod
+    def _get_pool(cls, pool_type):
+        # The pools are shared by all the Functions, and they're kept between the invocations of the orchestrator.
+        if pool_type not in cls._pools:
+            if pool_type == PoolTypes.PROCESS:
+                cls._pools[pool_type] = ProcessPoolExecutor()
+            else:
+                cls._pools[pool_type] = ThreadPoolExecutor()
+        return cls._pools[pool_type]
+
+    def launch(self):
+        try:
+            future = self._get_pool(self._pool_type).submit(self._function, self._get_parameters())
+            # A timed out callable can't be stopped, but the orchestration doesn't wait for it anymore.
+            return self._finished(future.result(timeout=self._timeout))
+        except Exception as e:
+            traceback.print_exc()
+            return self._failed(e)
+
+    async def launch_async(self, session=None):
+        loop = asyncio.get_event_loop()
+        try:
+            future = loop.run_in_executor(self._get_pool(self._pool_type), self._function, self._get_parameters())
+            return self._finished(await asyncio.wait_for(future, timeout=self._timeout))
+        except Exception as e:
+            traceback.print_exc()
+            return self._failed(e)
+
+    def _get_execution_id(self):
+        return f"function_{self.node_name}_{uuid.uuid4().hex}"
+
+    def _finished(self, result):
+        try:
+            json.dumps(result)
+        except (TypeError, ValueError):
+            result = str(result)
+        return {
+            'execution_id': self._get_execution_id(),
+            'task_name': self.target_name,
+            'node_name': self.node_name,
+            'succeeded': True,
+            'response': result
+        }
+
+    def _failed(self, e):
+        return {
+            'execution_id': self._get_execution_id(),
+            'task_name': self.target_name,
+            'node_name': self.node_name,
+            'succeeded': False,
+            'error': type(e).__name__,
+            'response': str(e).replace('"', "'")
+        }
 
 
 class CloudFunctionTask(Task):
@@ -110,38 +396,99 @@ class CloudFunctionTask(Task):
         self._gcp_project = kwargs.get('project_id', os.getenv('GCP_PROJECT'))
         self._region = kwargs.get('region', os.getenv('FUNCTION_REGION'))
         self._url = f"https://{self._region}-{self._gcp_project}.cloudfunctions.net/{self.target_name}"
+        self._launch_mode = LaunchModes(kwargs.get('launch_mode') or LaunchModes.SYNC.value)
+        self._launch_timeout = kwargs.get('launch_timeout') or 1.0
 
-    def execute(self):
+    def launch(self):
         import requests
         headers = self._authenticate()
         try:
-            response = requests.request("POST", self._url, json={"test": "hello"}, headers=headers)
-            print(response.text, response.headers)
+            if self._launch_mode == LaunchModes.ASYNC:
+                trace_id = self._set_trace(headers)
+                try:
+                    # We only wait until the request is accepted, and the function keeps running after the timeout.
+                    response = requests.request("POST", self._url, json=self._get_request_body(), headers=headers,
+                                                timeout=(10, self._launch_timeout))
+                    execution = self._launched(trace_id, response.text, response.headers.get('Function-Execution-Id'))
+                except requests.exceptions.ReadTimeout:
+                    execution = self._launched(trace_id, None)
+            else:
+                response = requests.request("POST", self._url, json=self._get_request_body(), headers=headers)
+                print(response.text, response.headers)
+                execution = self._launched(response.headers['Function-Execution-Id'], response.text)
+        except Exception as e:
+            traceback.print_exc()
+            execution = self._launch_failed(e)
 
-            execution = {
-                'execution_id': response.headers['Function-Execution-Id'],
-                'task_name': self.target_name,
-                'node_name': self.node_name,
-                'succeeded': True,
-                'response': response.text
-            }
-            self.set_status(TaskStatus.PENDING)
+        return execution
 
+    async def launch_async(self, session=None):
+        # Same as launch(), but uses the aiohttp session of the orchestrator service for the request.
+        import aiohttp
+        loop = asyncio.get_event_loop()
+        headers = await loop.run_in_executor(None, self._authenticate)
+        try:
+            if self._launch_mode == LaunchModes.ASYNC:
+                trace_id = self._set_trace(headers)
+                try:
+                    timeout = aiohttp.ClientTimeout(sock_read=self._launch_timeout)
+                    async with session.post(self._url, json=self._get_request_body(), headers=headers,
+                                            timeout=timeout) as response:
+                        text = await response.text()
+                        execution = self._launched(trace_id, text, response.headers.get('Function-Execution-Id'))
+                except asyncio.TimeoutError:
+                    execution = self._launched(trace_id, None)
+            else:
+                async with session.post(self._url, json=self._get_request_body(), headers=headers) as response:
+                    text = await response.text()
+                    print(text, response.headers)
+                    execution = self._launched(response.headers['Function-Execution-Id'], text)
         except Exception as e:
             traceback.print_exc()
-            execution = {
-                'task_name': self.target_name,
-                'node_name': self.node_name,
-                'succeeded': False,
-                'response': str(e).replace('"', "'")
-            }
-            self.set_status(TaskStatus.FAILED)
-
-        execution['run_id'] = self.parent_dag.orchestration_status.run_id
+            execution = self._launch_failed(e)
+
+        return execution
+
+    @staticmethod
+    def _set_trace(headers):
+        # The execution ID of a function is only returned when it finishes. So the asynchronous launches are tracked
+        # with a trace ID instead, which Cloud Functions attaches to the log lines of the execution.
+        trace_id = uuid.uuid4().hex
+        headers['X-Cloud-Trace-Context'] = f"{trace_id}/1;o=1"
+        return trace_id
+
+    def _get_request_body(self):
+        # The function gets the resolved parameters of the Task, with the references to the outputs of the previous
+        # Steps (and to its own output), instead of looking them up itself.
+        body = {'run_id': self.parent_dag.orchestration_status.run_id, **(self._get_parameters() or {})}
+        if self._map_index is not None:
+            body.update({'index': self._map_index, 'item': self._map_item})
+        output = self.get_output()
+        if output:
+            body['output'] = output
+        return body
+
+    def _launched(self, execution_id, response_text, function_execution_id=None):
+        execution = {
+            'execution_id': execution_id,
+            'task_name': self.target_name,
+            'node_name': self.node_name,
+            'succeeded': True,
+            'response': response_text
+        }
+        if function_execution_id:
+            execution['function_execution_id'] = function_execution_id
+        return execution
 
-        self.parent_dag.exec_status.save_execution(execution)
-        self.parent_dag.orchestration_status.update_task_status(self)
-        return execution, self
+    def _launch_failed(self, e):
+        return {
+            'execution_id': f"cloud_function_{self.target_name}_{int(time.time())}",
+            'task_name': self.target_name,
+            'node_name': self.node_name,
+            'succeeded': False,
+            'error': type(e).__name__,
+            'response': str(e).replace('"', "'")
+        }
 
     def _authenticate(self):
         import requests
@@ -194,54 +541,65 @@ class DataflowJob(Task):
             'template_type': self._template_type.value
         }
 
-    def execute(self):
+    @property
+    def cache_fields(self):
+        return {**super().cache_fields, 'template_path': self._template_path}
+
+    def _get_job_name(self):
+        # The names of the active Dataflow jobs must be unique, so the items of a Map Node get their own names.
+        if self._map_index is None:
+            return self._target_name
+        return f"{self._target_name}-{self._map_index}"
+
+    def launch(self):
         from googleapiclient.discovery import build
         from oauth2client.client import GoogleCredentials
 
         credentials = GoogleCredentials.get_application_default()
         dataflow = build('dataflow', 'v1b3', credentials=credentials, cache_discovery=False)
 
-        # TODO: Create subclasses for this.
-        if self._template_type == DataflowTemplateType.FLEX:
-            request = dataflow.projects().locations().flexTemplates().launch(
-                projectId=self._gcp_project,
-                location=self._dataflow_region,
-                body={
-                    'launch_parameter': {
-                        'jobName': self._target_name,
-                        'parameters': self._parameters,
-                        'environment': {
-                            'additionalUserLabels': {
-                                'name': 'flex_templates_example'
-                            }
-                        },
-                        'containerSpecGcsPath': self._template_path,
+        try:
+            # TODO: Create subclasses for this.
+            if self._template_type == DataflowTemplateType.FLEX:
+                request = dataflow.projects().locations().flexTemplates().launch(
+                    projectId=self._gcp_project,
+                    location=self._dataflow_region,
+                    body={
+                        'launch_parameter': {
+                            'jobName': self._get_job_name(),
+                            'parameters': self._get_parameters(),
+                            'environment': {
+                                'additionalUserLabels': {
+                                    'name': 'flex_templates_example'
+                                }
+                            },
+                            'containerSpecGcsPath': self._template_path,
+                        }
                     }
-                }
-            )
-        elif self._template_type == DataflowTemplateType.CLASSIC:
-            request = dataflow.projects().templates().launch(
-                projectId=self._gcp_project,
-                gcsPath=self._template_path,
-                body={
-                    'jobName': self._target_name,
-                    'parameters': self._parameters,
-                }
-            )
-        else:
-            raise Exception(f"Unexpected Dataflow job type: {self._template_type}")
+                )
+            elif self._template_type == DataflowTemplateType.CLASSIC:
+                request = dataflow.projects().templates().launch(
+                    projectId=self._gcp_project,
+                    gcsPath=self._template_path,
+                    body={
+                        'jobName': self._get_job_name(),
+                        'parameters': self._get_parameters(),
+                    }
+                )
+            else:
+                raise Exception(f"Unexpected Dataflow job type: {self._template_type}")
 
-        try:
             response = request.execute()
             print(response)
             execution = {
                 'execution_id': response['job']['id'],
                 'task_name': self.target_name,
                 'node_name': self.node_name,
+                'project_id': self._gcp_project,
+                'region': self._dataflow_region,
                 'succeeded': True,
                 'response': response
             }
-            self.set_status(TaskStatus.PENDING)
         except Exception as e:
             print(f"Exception occurred in executing Task: {self.node_name} --> {e}")
             traceback.print_exc()
@@ -250,16 +608,11 @@ class DataflowJob(Task):
                 'task_name': self.target_name,
                 'node_name': self.node_name,
                 'succeeded': False,
+                'error': type(e).__name__,
                 'response': str(e).replace('"', "'")
             }
-            self.set_status(TaskStatus.FAILED)
 
-        execution['run_id'] = self.parent_dag.orchestration_status.run_id
-
-        self.parent_dag.exec_status.save_execution(execution)
-        self.parent_dag.orchestration_status.update_task_status(self)
-
-        return execution, self
+        return execution
 
 
 class Parallel(Node):
@@ -300,14 +653,219 @@ class Parallel(Node):
     def to_json(self):
         return {
             **super().to_json(),
+            'status': self.status.value,
             'branches': [{'start': branch.start_node.node_name} for branch in self._branches]
         }
 
-    def execute(self):
-        print("Starting Parallel")
-        # Execute the Start Node of each branch, and then save the Execution Status for each of them.
-        for branch in self._branches:
-            start = branch.start_node
-            execution = start.execute()
-            self.parent_dag.exec_status.save_execution(execution[0])
+
+class Condition(Node):
+    # Chooses one of its branches inside the orchestrator, without launching anything. Each choice is a branch with a
+    # "condition": a Python callable that gets the response of the previous Task and the parameters of the run.
+    # The first branch with a truthy condition is chosen, and the "default" branch (if any) is chosen otherwise.
+    def __init__(self, node_name, *args, **kwargs):
+        super(Condition, self).__init__(node_name, *args, **kwargs)
+        self._node_type = NodeTypes.CONDITION
+        self._branches = []
+        self._conditions = []
+        self._status = TaskStatus.NEW
+
+    @property
+    def branches(self):
+        return self._branches
+
+    @property
+    def status(self):
+        return self._status
+
+    def set_status(self, status: TaskStatus):
+        self._status = status
+
+    def add_branch(self, branch_node, condition=None):
+        # The default branch doesn't have a condition, and it must be added as the last one.
+        self._branches.append(branch_node)
+        self._conditions.append(condition)
+
+    def choose(self, response, parameters):
+        for condition, branch in zip(self._conditions, self._branches):
+            if condition is None or condition(response, parameters):
+                return branch
         return None
+
+    def to_json(self):
+        return {
+            **super().to_json(),
+            'status': self.status.value,
+            'branches': [{'start': branch.start_node.node_name} for branch in self._branches]
+        }
+
+
+class Map(Node):
+    # Launches its "iterator" branch once for each item of a list that is only known at runtime, with at most
+    # "max_concurrency" items running at the same time. A new item is launched whenever a running one finishes.
+    # Only the counters and the running items are tracked (instead of a Node for each item), so it stays cheap even
+    # with thousands of items. The items themselves are saved once in their own object (see items_path).
+    def __init__(self, node_name, items=None, max_concurrency=None, *args, **kwargs):
+        super(Map, self).__init__(node_name, *args, **kwargs)
+        self._node_type = NodeTypes.MAP
+        self._items_source = items
+        self._max_concurrency = max_concurrency
+        self._iterator = None
+        self._status = TaskStatus.NEW
+        # The items are only read from their object when an item is launched.
+        self._items = None
+        self._items_path = None
+        self._item_count = 0
+        self._next_index = 0
+        self._completed = 0
+        self._failed = 0
+        self._running = dict()
+
+    @property
+    def branches(self):
+        return [self._iterator] if self._iterator else []
+
+    @property
+    def iterator(self):
+        return self._iterator
+
+    @property
+    def status(self):
+        return self._status
+
+    @property
+    def items(self):
+        if self._items is None:
+            self._items = self.parent_dag.orchestration_status.get_map_items(self._items_path) \
+                if self._items_path else []
+        return self._items
+
+    @property
+    def resolved(self):
+        # Whether the items were resolved, i.e. the Map Node didn't fail in its items callable.
+        return self._items_path is not None
+
+    @property
+    def running(self):
+        # The index of each running item, mapped to the name of the Node it's running.
+        return self._running
+
+    @property
+    def all_items_completed(self):
+        return self._completed == self._item_count
+
+    def set_status(self, status: TaskStatus):
+        self._status = status
+
+    def set_iterator(self, iterator):
+        self._iterator = iterator
+
+    def resolve_items(self, response, parameters):
+        # The items are either a parameter of the run, or returned by a callable like the conditions.
+        if callable(self._items_source):
+            items = self._items_source(response, parameters)
+        else:
+            items = parameters.get(self._items_source, [])
+        self._items = list(items)
+        self._item_count = len(self._items)
+        self._items_path = self.parent_dag.orchestration_status.save_map_items(self.node_name, self._items)
+        self._next_index = 0
+        self._completed = 0
+        self._failed = 0
+        self._running = dict()
+
+    def get_items_to_launch(self):
+        # Returns the indexes of the items that can be launched without exceeding the max_concurrency.
+        available = self._item_count - self._next_index
+        if self._max_concurrency:
+            available = min(available, self._max_concurrency - len(self._running))
+        indexes = list(range(self._next_index, self._next_index + max(available, 0)))
+        self._next_index += len(indexes)
+        return indexes
+
+    def set_running(self, index, node_name):
+        self._running[index] = node_name
+
+    def set_item_completed(self, index):
+        self._running.pop(index, None)
+        self._completed += 1
+
+    def set_item_failed(self, index):
+        # Failed items stay in the running items, so they can be resumed.
+        self._failed += 1
+
+    def reset_failures(self):
+        self._failed = 0
+
+    def load_state(self, orchestration_node):
+        self._items_path = orchestration_node.get('items_path')
+        self._item_count = orchestration_node.get('item_count', 0)
+        self._next_index = orchestration_node.get('next_index', 0)
+        self._completed = orchestration_node.get('completed', 0)
+        self._failed = orchestration_node.get('failed', 0)
+        self._running = {int(index): node_name for index, node_name in orchestration_node.get('running', {}).items()}
+
+    def to_json(self):
+        return {
+            **super().to_json(),
+            'status': self.status.value,
+            'iterator': {'start': self._iterator.start_node.node_name} if self._iterator else None,
+            'items_path': self._items_path,
+            'item_count': self._item_count,
+            'next_index': self._next_index,
+            'completed': self._completed,
+            'failed': self._failed,
+            'running': {str(index): node_name for index, node_name in self._running.items()}
+        }
+
+
+class SubWorkflow(Node):
+    # Runs a named workflow of the DAG definition ("workflows") as its only branch, with the Steps of the workflow
+    # scoped under the name of this Node: "LoadUsers/Extract". The branch is only built when the run reaches the Node
+    # (see DAGBuilder), so the workflows that are not active don't cost anything to the events of the run.
+    def __init__(self, node_name, workflow=None, parameters=None, *args, **kwargs):
+        super(SubWorkflow, self).__init__(node_name, *args, **kwargs)
+        self._node_type = NodeTypes.SUB_WORKFLOW
+        self._workflow_name = workflow
+        self._parameters = parameters
+        self._workflow = None
+        self._status = TaskStatus.NEW
+
+    @property
+    def branches(self):
+        return [self._workflow] if self._workflow else []
+
+    @property
+    def workflow_name(self):
+        return self._workflow_name
+
+    @property
+    def workflow(self):
+        # The DAG of the workflow, or None if it's not built yet.
+        return self._workflow
+
+    @property
+    def scope(self):
+        # The prefix of the names of the Steps of the workflow.
+        return f"{self.node_name}/"
+
+    @property
+    def status(self):
+        return self._status
+
+    def set_status(self, status: TaskStatus):
+        self._status = status
+
+    def set_workflow(self, workflow):
+        self._workflow = workflow
+
+    def get_parameters(self):
+        # The parameters of the workflow are resolved in the scope of this Node, so they can pass the outputs of the
+        # outer Steps to the Steps of the workflow: {"input": "${outputs.Extract.uri}"}
+        return Bindings.resolve(self._parameters, self.parent_dag.get_binding_context())
+
+    def to_json(self):
+        return {
+            **super().to_json(),
+            'status': self.status.value,
+            'workflow': self._workflow_name
+        }
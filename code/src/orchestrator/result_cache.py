@@ -0,0 +1,58 @@
+import json
+import time
+import hashlib
+
+from .status import CacheStatus
+
+
+class ResultCache:
+    # Memoizes the results of the Steps that define a `cache`, so a Task whose inputs didn't change since a successful
+    # execution (i.e. of a previous run) is completed without being launched again:
+    # "cache": {"inputs": ["gs://bucket/daily/2021-12-12/", "gs://bucket/dim/users.csv"], "ttl_seconds": 86400}
+    # The cache key is a hash of the target, its template (for Dataflow jobs) and its resolved parameters, and of the
+    # generations of the input objects (or of all the objects under an input prefix ending with '/').
+
+    def __init__(self, bucket):
+        self._cache_status = CacheStatus(bucket)
+        self._storage_client = None
+
+    def _get_storage_client(self):
+        if not self._storage_client:
+            from google.cloud import storage
+            self._storage_client = storage.Client()
+        return self._storage_client
+
+    def _get_generations(self, uri):
+        # i.e. "gs://bucket/path/to/object" or "gs://bucket/path/to/prefix/"
+        bucket_name, _, name = uri[len('gs://'):].partition('/')
+        bucket = self._get_storage_client().bucket(bucket_name)
+        if name.endswith('/'):
+            return {blob.name: blob.generation for blob in bucket.list_blobs(prefix=name)}
+        blob = bucket.get_blob(name)
+        return {name: blob.generation if blob else None}
+
+    def get_key(self, node):
+        inputs = {uri: self._get_generations(uri) for uri in node.cache.get('inputs', [])}
+        key_data = json.dumps({**node.cache_fields, 'inputs': inputs}, sort_keys=True, default=str)
+        return hashlib.sha256(key_data.encode('utf-8')).hexdigest()
+
+    def get_result(self, node, cache_key):
+        # Returns the cached execution for the key, unless it's older than the `ttl_seconds` of the Step.
+        result = self._cache_status.get_result(cache_key)
+        if not result:
+            return None
+        ttl = node.cache.get('ttl_seconds')
+        if ttl and result['completed'] + ttl < time.time():
+            return None
+        return result
+
+    def save_result(self, execution):
+        # Only the reference to the execution and its response are kept.
+        result = {
+            field: execution[field]
+            for field in ['execution_id', 'run_id', 'node_name', 'output', 'response', 'response_path',
+                          'response_truncated']
+            if field in execution
+        }
+        result['completed'] = int(time.time())
+        self._cache_status.save_result(execution['cache_key'], result)
@@ -0,0 +1,50 @@
+import random
+
+
+class RetryPolicy:
+    # Defines how a failed Task is retried, using the "retry" attribute of its Step:
+    #   "retry": {
+    #       "max_attempts": 3,             # Including the first attempt.
+    #       "interval_seconds": 30,        # Delay before the first retry.
+    #       "backoff_rate": 2.0,           # Multiplier of the delay for each subsequent retry.
+    #       "max_interval_seconds": 3600,  # Upper limit of the delay.
+    #       "jitter": True,                # Randomizes the delay, so the retries of several runs are spread out.
+    #       "errors": ["ConnectionError", "TaskFailed"]  # Error classes to retry. Defaults to all the errors.
+    #   }
+    # The error class of a launch failure is the class name of the exception (i.e. "HttpError"), and it's
+    # "TaskFailed" when the Task was launched, but it failed afterwards.
+
+    ALL_ERRORS = 'All'
+    TASK_FAILED = 'TaskFailed'
+
+    def __init__(self, max_attempts=1, interval_seconds=30, backoff_rate=2.0, max_interval_seconds=3600, jitter=True,
+                 errors=None):
+        self._max_attempts = max_attempts
+        self._interval_seconds = interval_seconds
+        self._backoff_rate = backoff_rate
+        self._max_interval_seconds = max_interval_seconds
+        self._jitter = jitter
+        self._errors = errors or [self.ALL_ERRORS]
+
+    @staticmethod
+    def from_definition(retry):
+        if not retry:
+            return None
+        return RetryPolicy(**retry)
+
+    @property
+    def max_attempts(self):
+        return self._max_attempts
+
+    def should_retry(self, error, attempts):
+        if attempts >= self._max_attempts:
+            return False
+        return self.ALL_ERRORS in self._errors or error in self._errors
+
+    def get_delay(self, attempts):
+        # Exponential backoff, with the first retry happening after interval_seconds.
+        delay = min(self._interval_seconds * self._backoff_rate ** (attempts - 1), self._max_interval_seconds)
+        if self._jitter:
+            # "Equal jitter": keeps at least half of the backoff, and randomizes the other half.
+            delay = delay / 2 + random.uniform(0, delay / 2)
+        return delay
@@ -0,0 +1,291 @@
+import json
+import time
+import asyncio
+import traceback
+
+from .dag_executor import DAGExecutor
+from .dataflow_poller import DataflowJobPoller
+from .watchdog import TaskWatchdog
+from .status import OrchestrationStatus, BufferedExecutionStatus
+from .events import EventsFactory, Retry
+from .enums import ScheduledEvents
+
+
+class OrchestratorService(DAGExecutor):
+    """
+    Long-running alternative to triggering the DAGExecutor from a Cloud Function for every event.
+
+    It consumes the same events (i.e. from a Pub/Sub subscription), but keeps the DAGs and the statuses of the active
+    runs in memory, and only writes them to GCS every `checkpoint_interval` seconds. The Pub/Sub messages are
+    acknowledged only after the checkpoint that includes them (with the executions of the Tasks they launched), so no
+    event is lost if the service goes down. The messages whose processing failed are not acknowledged at all, so
+    Pub/Sub redelivers them.
+    """
+
+    def __init__(self, dag_definition, bucket_name, checkpoint_interval=5, run_ttl=3600, max_concurrent_launches=500,
+                 concurrency_limits=None):
+        super(OrchestratorService, self).__init__(dag_definition, bucket_name, concurrency_limits)
+        self._exec_status = BufferedExecutionStatus(self._bucket)
+        self._checkpoint_interval = checkpoint_interval
+        self._run_ttl = run_ttl
+        self._max_concurrent_launches = max_concurrent_launches
+
+        self._runs = dict()
+        self._last_seen = dict()
+        self._dirty = set()
+        self._pending_acks = []
+        self._launches = set()
+        # The events that are being processed and the launches that are not recorded yet. The checkpoints wait for
+        # them, so a saved run never has a Node that was triggered but not launched.
+        self._unrecorded = 0
+
+        # These are created in serve(), as they need to belong to the running event loop.
+        self._loop = None
+        self._queue = None
+        self._session = None
+        self._launch_slots = None
+        # The DAGs are changed in the worker threads (i.e. while processing an event or recording a launch), so only
+        # one thread at a time can change or snapshot them. The launches themselves don't change the Tasks.
+        self._dag_lock = None
+        self._recorded = None
+        self._accepting = None
+
+    def submit(self, data, ack=None):
+        # Adds an event to the queue. This must be called from the event loop of the service.
+        self._queue.put_nowait((data, ack))
+
+    async def serve(self, subscription=None, max_messages=10000):
+        import aiohttp
+
+        self._loop = asyncio.get_event_loop()
+        self._queue = asyncio.Queue()
+        self._launch_slots = asyncio.Semaphore(self._max_concurrent_launches)
+        self._dag_lock = asyncio.Lock()
+        self._recorded = asyncio.Event()
+        self._recorded.set()
+        self._accepting = asyncio.Event()
+        self._accepting.set()
+
+        streaming_pull = self._subscribe(subscription, max_messages) if subscription else None
+
+        async with aiohttp.ClientSession() as session:
+            self._session = session
+            checkpoints = self._loop.create_task(self._checkpoint_loop())
+            try:
+                while True:
+                    data, ack = await self._queue.get()
+                    # The events wait while a checkpoint waits for the launches.
+                    await self._accepting.wait()
+                    await self._handle_event(data, ack)
+            finally:
+                if streaming_pull:
+                    streaming_pull.cancel()
+                checkpoints.cancel()
+                if self._launches:
+                    await asyncio.gather(*self._launches, return_exceptions=True)
+                await self.checkpoint()
+
+    def _subscribe(self, subscription, max_messages):
+        from google.cloud import pubsub_v1
+
+        subscriber = pubsub_v1.SubscriberClient()
+
+        def callback(message):
+            # Called from the threads of the subscriber, so we hand the event over to the event loop.
+            data = json.loads(message.data.decode('utf-8'))
+            self._loop.call_soon_threadsafe(self.submit, data, message.ack)
+
+        # The messages are only acknowledged on checkpoints, so they stay outstanding until then.
+        flow_control = pubsub_v1.types.FlowControl(max_messages=max_messages)
+        return subscriber.subscribe(subscription, callback=callback, flow_control=flow_control)
+
+    def _begin_unrecorded(self):
+        self._unrecorded += 1
+        self._recorded.clear()
+
+    def _end_unrecorded(self, *_):
+        self._unrecorded -= 1
+        if not self._unrecorded:
+            self._recorded.set()
+
+    async def _handle_event(self, data, ack):
+        self._begin_unrecorded()
+        try:
+            scheduled_event = EventsFactory.get_scheduled_event(data)
+            if scheduled_event == ScheduledEvents.DATAFLOW_POLL:
+                self._loop.create_task(self._poll_dataflow_jobs())
+            elif scheduled_event == ScheduledEvents.RETRY_POLL:
+                self._loop.create_task(self._run_due_retries())
+            elif scheduled_event == ScheduledEvents.WATCHDOG:
+                self._loop.create_task(self._sweep_stuck_tasks())
+            elif self._matches_sink_filter(data):
+                # The events are still processed one by one, but the GCS calls of their processing (i.e. loading the
+                # DAG of the run, or saving the results) don't block the launches.
+                processed = await self._run_locked(self._process_data, data)
+                if processed:
+                    run_id, next_nodes = processed
+                    for next_node in next_nodes:
+                        print(f"Next node: {next_node.node_name}")
+                        self._start_launch(run_id, next_node)
+        except Exception as e:
+            print(f"Error in processing the event: {data} --> {e}")
+            traceback.print_exc()
+            return
+        finally:
+            self._end_unrecorded()
+
+        if ack:
+            self._pending_acks.append(ack)
+
+    async def _run_locked(self, func, *args):
+        # Runs a blocking call that changes the DAGs in a worker thread. The launches that it dequeued are submitted
+        # while the lock is still held, so no other thread adds to them meanwhile.
+        async with self._dag_lock:
+            result = await self._loop.run_in_executor(None, func, *args)
+            self._launch_dequeued()
+        return result
+
+    def _process_data(self, data):
+        # Called from a worker thread. Returns the run and the next Nodes to launch, if the event belongs to a run.
+        task = EventsFactory.create_from_event(event_data=data)
+        if not task:
+            print(f"The event is not recognized: {data}")
+            return None
+
+        run_id = self._resolve_run_id(task)
+        if not run_id:
+            print(f"No run found for the execution: {task.execution_id}")
+            return None
+
+        dag = self._get_run_dag(run_id)
+        next_nodes = self._process_event(task, dag)
+        self._dirty.add(run_id)
+        return run_id, next_nodes
+
+    async def _poll_dataflow_jobs(self):
+        # The Dataflow API is called from a worker thread, and the detected completions go through the queue.
+        poller = DataflowJobPoller(self._exec_status)
+        for event_data in await self._loop.run_in_executor(None, poller.poll):
+            self.submit(event_data)
+
+    async def _sweep_stuck_tasks(self):
+        watchdog = TaskWatchdog(self._exec_status)
+        for event_data in await self._loop.run_in_executor(None, watchdog.sweep):
+            self.submit(event_data)
+
+    async def _run_due_retries(self):
+        # Picks up the retries that were scheduled before a restart of the service.
+        due_retries = await self._loop.run_in_executor(None, self._retry_status.get_due_retries, int(time.time()))
+        for retry in due_retries:
+            self.submit(Retry.event_data(**retry))
+
+        for event_data in await self._loop.run_in_executor(None, self._launch_limiter.dequeue_free):
+            self.submit(event_data)
+
+    def _launch_dequeued(self):
+        # The dequeued launches go through the queue like any other event, as they can belong to other runs.
+        dequeued, self._dequeued = self._dequeued, []
+        for event_data in dequeued:
+            self.submit(event_data)
+
+    def _schedule_retry(self, run_id, node, delay):
+        # The retry is still saved, so it's not lost if the service restarts. But we don't need to wait for the
+        # next retry poll to execute it.
+        due = super(OrchestratorService, self)._schedule_retry(run_id, node, delay)
+        # This is called from a worker thread, so the timer is set in the event loop.
+        self._loop.call_soon_threadsafe(self._loop.call_later, delay, self.submit,
+                                        Retry.event_data(run_id, node.node_name, node.attempts, due))
+        return due
+
+    def _get_run_dag(self, run_id):
+        # Builds the DAG only once per run, and then keeps it (with the statuses of its Nodes) in memory.
+        self._last_seen[run_id] = time.time()
+        dag = self._runs.get(run_id)
+        if not dag:
+            dag = self._build_dag(OrchestrationStatus(self._bucket, run_id))
+            self._runs[run_id] = dag
+        return dag
+
+    async def _launch(self, run_id, node):
+        async with self._launch_slots:
+            execution = await self._run_locked(self._get_cached_execution, node)
+            if not execution:
+                if not await self._run_locked(self._acquire_slots, node):
+                    self._dirty.add(run_id)
+                    return
+                execution = await node.launch_async(self._session)
+                execution, _ = await self._run_locked(node.record_execution, execution)
+
+        finished_successors = await self._run_locked(self._after_launch, node, execution)
+        self._dirty.add(run_id)
+
+        for next_node in finished_successors:
+            print(f"Next node: {next_node.node_name}")
+            self._start_launch(run_id, next_node)
+
+    def _start_launch(self, run_id, node):
+        self._begin_unrecorded()
+        launch = self._loop.create_task(self._launch(run_id, node))
+        self._launches.add(launch)
+        launch.add_done_callback(self._launches.discard)
+        launch.add_done_callback(self._end_unrecorded)
+
+    async def _checkpoint_loop(self):
+        while True:
+            await asyncio.sleep(self._checkpoint_interval)
+            try:
+                await self.checkpoint()
+            except Exception as e:
+                print(f"Error in saving the checkpoint: {e}")
+                traceback.print_exc()
+
+    async def _wait_recorded(self):
+        # Returns holding the lock of the DAGs, once all the processed events have their launches recorded. No new
+        # events are processed meanwhile, so only the launches that are already started have to finish.
+        self._accepting.clear()
+        try:
+            while True:
+                await self._recorded.wait()
+                await self._dag_lock.acquire()
+                if not self._unrecorded:
+                    return
+                self._dag_lock.release()
+        finally:
+            self._accepting.set()
+
+    async def checkpoint(self):
+        # The snapshots are taken in the event loop, and only the uploads are done in the worker threads.
+        await self._wait_recorded()
+        try:
+            acks, self._pending_acks = self._pending_acks, []
+            dirty, self._dirty = self._dirty, set()
+            uploads = [self._loop.run_in_executor(None, self._exec_status.flush)]
+            for run_id in dirty:
+                self._summarize_run(self._runs[run_id])
+                orchestration_status = self._runs[run_id].orchestration_status
+                uploads.append(self._loop.run_in_executor(
+                    None, orchestration_status.save_orchestration_status, orchestration_status.snapshot()))
+        finally:
+            self._dag_lock.release()
+
+        try:
+            await asyncio.gather(*uploads)
+        except Exception:
+            # Retry these in the next checkpoint.
+            self._dirty.update(dirty)
+            self._pending_acks = acks + self._pending_acks
+            raise
+
+        for ack in acks:
+            ack()
+
+        self._evict_idle_runs()
+
+    def _evict_idle_runs(self):
+        expiry = time.time() - self._run_ttl
+        for run_id, last_seen in list(self._last_seen.items()):
+            if last_seen < expiry and run_id not in self._dirty:
+                print(f"Evicting the idle run: {run_id}")
+                self._runs.pop(run_id, None)
+                self._last_seen.pop(run_id, None)
+                self._exec_status.evict(run_id)
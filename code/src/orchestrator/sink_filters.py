@@ -0,0 +1,94 @@
+import re
+
+from .dag_builder import DAGBuilder
+from .events import DataflowEvent
+from .enums import NodeTypes, TargetTypes
+
+
+class SinkFilter:
+    # Generates the filters of the log sinks (see log_sinks.tf) from the DAG definitions, so the orchestrator is only
+    # invoked for the completion log lines of its own Cloud Functions and Dataflow jobs. The same filter is applied to
+    # the incoming events with matches(), to detect (and drop) the events that a broader filter lets through.
+    CLOUD_FUNCTION_MESSAGE = "Function execution took"
+
+    def __init__(self, dag_definitions):
+        self._function_names = set()
+        self._job_names = set()
+        # The Dataflow jobs of the Map items are named as "<target_name>-<index>".
+        self._map_job_names = set()
+
+        # The named workflows of the SubWorkflow Steps have their own Steps.
+        definitions = [
+            (definition, dag_definition.get('workflows', dict()))
+            for dag_definition in dag_definitions
+            for definition in [dag_definition, *dag_definition.get('workflows', dict()).values()]
+        ]
+        for definition, workflows in definitions:
+            steps = DAGBuilder(dag=definition, exec_status=None, orchestration_status=None,
+                               workflows=workflows).get_steps()
+            map_steps = {
+                step_name
+                for step in steps.values() if step['type'] == NodeTypes.MAP.value
+                for step_name in step['iterator']['steps']
+            }
+            for step_name, step in steps.items():
+                if step['type'] != NodeTypes.TASK.value:
+                    continue
+                if step['target_type'] == TargetTypes.CLOUD_FUNCTION.value:
+                    self._function_names.add(step['target_name'])
+                elif step['target_type'] == TargetTypes.DATAFLOW_JOB.value:
+                    names = self._map_job_names if step_name in map_steps else self._job_names
+                    names.add(step['target_name'])
+
+        self._map_job_pattern = re.compile(
+            r"^(%s)-[0-9]+$" % '|'.join(re.escape(name) for name in sorted(self._map_job_names))
+        ) if self._map_job_names else None
+
+    @staticmethod
+    def _any_of(conditions, label):
+        # Without any condition, the label is compared to an empty name, so the log lines of a target type that the
+        # DAG doesn't use are not forwarded at all.
+        return f"({' OR '.join(conditions)})" if conditions else f'resource.labels.{label}=""'
+
+    def get_dataflow_filter(self):
+        job_names = [f'resource.labels.job_name="{name}"' for name in sorted(self._job_names)]
+        if self._map_job_pattern:
+            job_names.append(f'resource.labels.job_name=~"{self._map_job_pattern.pattern}"')
+        messages = [f'textPayload:"{message}"' for message, _ in DataflowEvent.TERMINAL_MESSAGES]
+        return (f'resource.type="dataflow_step" AND {self._any_of(job_names, "job_name")} '
+                f'AND {self._any_of(messages, "job_name")}')
+
+    def get_cloud_function_filter(self):
+        function_names = [f'resource.labels.function_name="{name}"' for name in sorted(self._function_names)]
+        return (f'resource.type="cloud_function" AND {self._any_of(function_names, "function_name")} '
+                f'AND textPayload:"{self.CLOUD_FUNCTION_MESSAGE}"')
+
+    def to_tfvars(self):
+        return {
+            'dataflow_sink_filter': self.get_dataflow_filter(),
+            'cloud_function_sink_filter': self.get_cloud_function_filter()
+        }
+
+    def matches(self, event_data):
+        # The events that are not from the log sinks (i.e. start, retry or the events of the DataflowJobPoller)
+        # always match.
+        resource = event_data['resource']
+        if resource['type'] == 'dataflow_step' and 'job_state' not in event_data:
+            job_name = resource['labels']['job_name']
+            text_payload = event_data.get('textPayload', '')
+            return (job_name in self._job_names or bool(self._map_job_pattern and self._map_job_pattern.match(job_name))) \
+                and any(message in text_payload for message, _ in DataflowEvent.TERMINAL_MESSAGES)
+        if resource['type'] == 'cloud_function':
+            return resource['labels']['function_name'] in self._function_names \
+                and self.CLOUD_FUNCTION_MESSAGE in event_data.get('textPayload', '')
+        return True
+
+    def check_deployed(self, dataflow_filter=None, cloud_function_filter=None):
+        # Returns the names of the deployed filters that are not the ones generated from the DAG definitions.
+        outdated = []
+        if dataflow_filter is not None and dataflow_filter != self.get_dataflow_filter():
+            outdated.append('dataflow_sink_filter')
+        if cloud_function_filter is not None and cloud_function_filter != self.get_cloud_function_filter():
+            outdated.append('cloud_function_sink_filter')
+        return outdated
+
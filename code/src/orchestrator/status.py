@@ -1,53 +1,243 @@
+import gzip
 import json
+import time
 from json.decoder import JSONDecodeError
+from urllib.parse import quote, unquote
+
+from google.api_core.exceptions import NotFound, PreconditionFailed
 
 from .nodes import Task
+from .enums import TaskStatus
 
 
 class Status:
+    # The status files are written as compact JSON compressed with gzip, and the version of this encoding is kept in
+    # the metadata of the objects. The plain JSON files of the older versions can still be read.
+    ENCODING = 'json+gzip/1'
+    GZIP_MAGIC = b'\x1f\x8b'
+
     def __init__(self, bucket):
         self._bucket = bucket
 
+    @classmethod
+    def _encode(cls, content):
+        return gzip.compress(json.dumps(content, separators=(',', ':')).encode('utf-8'), compresslevel=6)
+
+    @classmethod
+    def _decode(cls, data):
+        # Compressed files are detected by their content, as a JSON document can't start with the gzip magic number.
+        if data[:2] == cls.GZIP_MAGIC:
+            data = gzip.decompress(data)
+        return json.loads(data)
+
+    @staticmethod
+    def _quote(segment):
+        # A segment of an object path that can contain '/' itself, i.e. the key of a limit: "CloudFunction/function"
+        return quote(segment, safe='')
+
+    def _upload(self, file_path, content):
+        blob = self._bucket.blob(file_path)
+        blob.metadata = {'encoding': self.ENCODING}
+        blob.upload_from_string(self._encode(content), content_type='application/gzip')
+        return blob
+
     def _read_json_from_gcs(self, file_path):
         blob = self._bucket.get_blob(file_path)
         if not blob:
             return {}
-        json_string = blob.download_as_string()
+        data = blob.download_as_string()
         try:
-            json_data = json.loads(json_string)
-        except JSONDecodeError as e:
+            json_data = self._decode(data)
+        except (JSONDecodeError, OSError) as e:
             print("Error in reading status file: ", e)
             return {}
         return json_data
 
     def _write_json_to_gcs(self, file_path, file_content):
-        blob = self._bucket.blob(file_path)
-        blob.upload_from_string(json.dumps(file_content))
+        blob = self._upload(file_path, file_content)
         if not blob or not blob.exists():
             print("Error in saving status file.")
 
 
 class ExecutionStatus(Status):
+    # Fields of an execution that are kept in the metadata of its in-flight marker.
+    IN_FLIGHT_FIELDS = ['run_id', 'node_name', 'task_name', 'project_id', 'region', 'deadline']
+
+    # Responses (as JSON) longer than this are saved in their own objects, so the executions, which are read for
+    # every event, stay small. Responses longer than MAX_RESPONSE_SIZE are dropped, as a part of a JSON text isn't a
+    # response, and only the response_truncated flag is kept.
+    MAX_INLINE_RESPONSE_SIZE = 2048
+    MAX_RESPONSE_SIZE = 1024 * 1024
+
     def __init__(self, bucket_name):
         super(ExecutionStatus, self).__init__(bucket_name)
         self._prefix = 'executions'
+        self._in_flight_prefix = 'in_flight'
+        self._response_prefix = 'responses'
 
     def get_execution(self, execution_id):
         file_path = f"{self._prefix}/{execution_id}.json"
         return self._read_json_from_gcs(file_path)
 
+    def get_response(self, execution):
+        # Returns the response of the execution, reading it from its own object if it was too long to keep inline.
+        # It's None if the response was too long to save at all (see response_truncated).
+        if not execution:
+            return None
+        if 'response_path' in execution:
+            return self._read_json_from_gcs(execution['response_path'])
+        return execution.get('response')
+
+    def save_execution(self, execution):
+        execution_id = execution['execution_id']
+        self._write_json_to_gcs(f"{self._prefix}/{execution_id}.json", self._offload_response(execution))
+
+    def _offload_response(self, execution):
+        # Returns the execution to save, with its response moved to its own object if it's too long.
+        response = execution.get('response')
+        encoded_response = json.dumps(response, separators=(',', ':'))
+        if len(encoded_response) <= self.MAX_INLINE_RESPONSE_SIZE:
+            return execution
+
+        execution = {key: value for key, value in execution.items() if key != 'response'}
+        if len(encoded_response) > self.MAX_RESPONSE_SIZE:
+            execution['response'] = None
+            execution['response_truncated'] = True
+            return execution
+
+        response_path = f"{self._response_prefix}/{execution['execution_id']}.json"
+        self._write_json_to_gcs(response_path, response)
+        execution['response_path'] = response_path
+        return execution
+
+    def _get_in_flight_path(self, target_type, execution_id):
+        return '/'.join([self._in_flight_prefix, target_type, execution_id])
+
+    def set_in_flight(self, execution):
+        # Marks the execution as in-flight with an empty object, so the in-flight executions of a target type can
+        # be found by listing a small prefix, without reading the executions (or the runs) themselves.
+        blob = self._bucket.blob(self._get_in_flight_path(execution['target_type'], execution['execution_id']))
+        blob.metadata = {
+            field: str(execution[field]) for field in self.IN_FLIGHT_FIELDS if execution.get(field) is not None
+        }
+        blob.upload_from_string('')
+
+    def clear_in_flight(self, target_type, execution_id):
+        try:
+            self._bucket.blob(self._get_in_flight_path(target_type, execution_id)).delete()
+        except NotFound:
+            pass
+
+    def list_in_flight(self, target_type):
+        prefix = '/'.join([self._in_flight_prefix, target_type, ''])
+        return [
+            {
+                **(blob.metadata or {}),
+                'execution_id': blob.name[len(prefix):],
+                'target_type': target_type,
+                'started': blob.time_created
+            }
+            for blob in self._bucket.list_blobs(prefix=prefix)
+        ]
+
+
+class BufferedExecutionStatus(ExecutionStatus):
+    # Keeps the executions in memory and only writes them to GCS on flush().
+    # This is used by the long-running orchestrator service, where most of the completion events are for the
+    # executions it launched itself, so they never need to be read back from GCS.
+    def __init__(self, bucket_name):
+        super(BufferedExecutionStatus, self).__init__(bucket_name)
+        self._executions = dict()
+        self._run_executions = dict()
+        self._unsaved = dict()
+        self._unsaved_in_flight = dict()
+
+    def _cache(self, execution_id, execution):
+        self._executions[execution_id] = execution
+        self._run_executions.setdefault(execution.get('run_id'), set()).add(execution_id)
+
+    def get_execution(self, execution_id):
+        execution = self._executions.get(execution_id)
+        if execution is None:
+            execution = super(BufferedExecutionStatus, self).get_execution(execution_id)
+            if execution:
+                self._cache(execution_id, execution)
+        return execution
+
     def save_execution(self, execution):
         execution_id = execution['execution_id']
-        self._write_json_to_gcs(f"{self._prefix}/{execution_id}.json", execution)
+        self._cache(execution_id, execution)
+        self._unsaved[execution_id] = execution
+
+    def set_in_flight(self, execution):
+        self._unsaved_in_flight[(execution['target_type'], execution['execution_id'])] = execution
+
+    def clear_in_flight(self, target_type, execution_id):
+        self._unsaved_in_flight[(target_type, execution_id)] = None
+
+    def list_in_flight(self, target_type):
+        in_flight = {
+            execution['execution_id']: execution
+            for execution in super(BufferedExecutionStatus, self).list_in_flight(target_type)
+        }
+        # Apply the changes that are not saved yet on top of the saved ones.
+        for (execution_target_type, execution_id), execution in list(self._unsaved_in_flight.items()):
+            if execution_target_type != target_type:
+                continue
+            if execution is None:
+                in_flight.pop(execution_id, None)
+            else:
+                in_flight[execution_id] = execution
+        return list(in_flight.values())
+
+    def flush(self):
+        # The executions are saved before their in-flight markers, so every marker can be resolved to a run.
+        self._flush_executions()
+        self._flush_in_flight()
+
+    def _flush_in_flight(self):
+        unsaved, self._unsaved_in_flight = self._unsaved_in_flight, dict()
+        try:
+            for key, execution in list(unsaved.items()):
+                if execution is None:
+                    super(BufferedExecutionStatus, self).clear_in_flight(*key)
+                else:
+                    super(BufferedExecutionStatus, self).set_in_flight(execution)
+                del unsaved[key]
+        finally:
+            for key, execution in unsaved.items():
+                self._unsaved_in_flight.setdefault(key, execution)
+
+    def _flush_executions(self):
+        unsaved, self._unsaved = self._unsaved, dict()
+        try:
+            for execution_id, execution in list(unsaved.items()):
+                super(BufferedExecutionStatus, self).save_execution(execution)
+                del unsaved[execution_id]
+        finally:
+            # Whatever couldn't be saved is kept for the next flush, unless it was updated in the meantime.
+            for execution_id, execution in unsaved.items():
+                self._unsaved.setdefault(execution_id, execution)
+
+    def evict(self, run_id):
+        # Drops the cached executions of a run. The unsaved ones must be flushed before evicting.
+        for execution_id in self._run_executions.pop(run_id, set()):
+            self._executions.pop(execution_id, None)
 
 
 class OrchestrationStatus(Status):
+    # The information about the run itself is kept next to the Nodes, with a key that can't be a Step name.
+    RUN_KEY = '_run'
+
     def __init__(self, bucket_name, run_id=None):
         super(OrchestrationStatus, self).__init__(bucket_name)
         self._prefix = 'runs'
         self._orchestration_status_file = 'orchestration_status.json'
         self._run_id = run_id
         self._status_data = None
+        self._run_index = RunIndex(bucket_name)
+        # The summary of the run in the run index, so the index is only written when the summary changes.
+        self._indexed_summary = None
         self.set_run_id(run_id)
 
     def set_initial_status(self, status_data):
@@ -57,11 +247,50 @@ class OrchestrationStatus(Status):
     def run_id(self):
         return self._run_id
 
+    @property
+    def run_parameters(self):
+        return self._status_data.get(self.RUN_KEY, {}).get('parameters', {})
+
+    def set_run_parameters(self, parameters):
+        run = self._status_data.get(self.RUN_KEY, {})
+        self._status_data[self.RUN_KEY] = {**run, 'parameters': parameters}
+
+    @property
+    def run_outputs(self):
+        return self._status_data.get(self.RUN_KEY, {}).get('outputs', {})
+
+    def set_output(self, node_name, output):
+        # Only the references to the outputs of the Tasks are kept in the run, and never the data itself.
+        run = self._status_data.get(self.RUN_KEY, {})
+        self._status_data[self.RUN_KEY] = {**run, 'outputs': {**run.get('outputs', {}), node_name: output}}
+
+    @property
+    def run_priority(self):
+        return self._status_data.get(self.RUN_KEY, {}).get('priority', 0)
+
+    def set_run_priority(self, priority):
+        run = self._status_data.get(self.RUN_KEY, {})
+        self._status_data[self.RUN_KEY] = {**run, 'priority': priority}
+
+    def set_run_summary(self, state: TaskStatus, frontier):
+        # The state of the run and its running Nodes, which are kept in the run index as well.
+        run = self._status_data.get(self.RUN_KEY, {})
+        now = int(time.time())
+        finished = (run.get('finished') or now) if state in (TaskStatus.COMPLETED, TaskStatus.FAILED) else None
+        self._status_data[self.RUN_KEY] = {
+            **run,
+            'state': state.value,
+            'frontier': frontier,
+            'started': run.get('started') or now,
+            'finished': finished
+        }
+
     def set_run_id(self, run_id):
         # When the run_id is set, it will load the status from the corresponding file.
         self._run_id = run_id
         if run_id:
             self._status_data = self._read_status_file()
+            self._indexed_summary = RunIndex.get_summary(self._status_data.get(self.RUN_KEY, {}))
 
     def _get_status_file_path(self):
         return '/'.join([self._prefix, self._run_id, self._orchestration_status_file])
@@ -77,7 +306,249 @@ class OrchestrationStatus(Status):
     def get_task_status(self, node_name):
         return self._status_data.get(node_name)
 
-    def save_orchestration_status(self):
-        blob = self._bucket.blob(self._get_status_file_path())
-        blob.upload_from_string(json.dumps(self._status_data))
+    def save_map_items(self, node_name, items):
+        # The items of a Map Node are saved once in their own object, instead of with every save of the status.
+        file_path = '/'.join([self._prefix, self._run_id, 'map_items', f"{self._quote(node_name)}.json"])
+        self._write_json_to_gcs(file_path, items)
+        return file_path
 
+    def get_map_items(self, file_path):
+        return self._read_json_from_gcs(file_path) or []
+
+    def snapshot(self):
+        # The Node entries are replaced (not mutated) on every update, so a shallow copy is enough to
+        # save the status from another thread while the orchestration keeps going.
+        return dict(self._status_data)
+
+    def save_orchestration_status(self, status_data=None):
+        status_data = self._status_data if status_data is None else status_data
+        self._upload(self._get_status_file_path(), status_data)
+        self._update_run_index(status_data.get(self.RUN_KEY, {}))
+
+    def _update_run_index(self, run):
+        summary = RunIndex.get_summary(run)
+        if not summary['state'] or summary == self._indexed_summary:
+            return
+        previous_state = (self._indexed_summary or {}).get('state')
+        self._run_index.update(self._run_id, summary, previous_state)
+        self._indexed_summary = summary
+
+
+class RunIndex(Status):
+    # Keeps an empty object per run (run_index/<state>/<run_id>) with the summary of the run in its metadata. So the
+    # runs in a state can be listed with a single request per page, instead of reading the status files of all the runs.
+    FIELDS = ['state', 'started', 'finished', 'frontier']
+
+    def __init__(self, bucket_name):
+        super(RunIndex, self).__init__(bucket_name)
+        self._prefix = 'run_index'
+
+    @classmethod
+    def get_summary(cls, run):
+        return {field: run.get(field) for field in cls.FIELDS}
+
+    def _get_run_path(self, state, run_id):
+        return '/'.join([self._prefix, state, run_id])
+
+    def update(self, run_id, summary, previous_state=None):
+        blob = self._bucket.blob(self._get_run_path(summary['state'], run_id))
+        blob.metadata = {field: json.dumps(summary[field]) for field in self.FIELDS}
+        blob.upload_from_string('')
+
+        if previous_state and previous_state != summary['state']:
+            try:
+                self._bucket.blob(self._get_run_path(previous_state, run_id)).delete()
+            except NotFound:
+                pass
+
+    def query(self, state: TaskStatus = None, started_after=None, started_before=None, node_name=None,
+              page_size=100, page_token=None):
+        # Returns a page of the runs, and the token of the next page (if any). The runs of a state are in the order of
+        # their run_ids. Without a state, all the runs are listed by their state first (i.e. the Completed runs before
+        # the Failed ones), as the state is part of the path. The other filters are applied while listing, which goes
+        # on until page_size runs match, so a sparse filter can list many index entries for a single page. The token is
+        # the path of the last returned run, and the next page is listed from the entry after it.
+        prefix = '/'.join([self._prefix, state.value, '']) if state else self._prefix + '/'
+
+        runs = []
+        last_path = None
+        for blob in self._bucket.list_blobs(prefix=prefix, start_offset=page_token):
+            if blob.name == page_token:
+                continue
+            run = {field: json.loads(value) for field, value in (blob.metadata or {}).items() if field in self.FIELDS}
+            run['run_id'] = blob.name.rsplit('/', 1)[-1]
+            started = run.get('started') or 0
+            if started_after is not None and started < started_after:
+                continue
+            if started_before is not None and started >= started_before:
+                continue
+            if node_name is not None and node_name not in (run.get('frontier') or []):
+                continue
+            if len(runs) == page_size:
+                # There's at least one more run, so there's a next page.
+                return runs, last_path
+            runs.append(run)
+            last_path = blob.name
+
+        return runs, None
+
+
+class CacheStatus(Status):
+    # Keeps the results of the successful executions by their cache keys (see ResultCache).
+    def __init__(self, bucket_name):
+        super(CacheStatus, self).__init__(bucket_name)
+        self._prefix = 'cache'
+
+    def get_result(self, cache_key):
+        return self._read_json_from_gcs(f"{self._prefix}/{cache_key}.json")
+
+    def save_result(self, cache_key, result):
+        self._write_json_to_gcs(f"{self._prefix}/{cache_key}.json", result)
+
+
+class RetryStatus(Status):
+    # Keeps the scheduled retries as empty objects named by their due time (retries/<due>/<run_id>/<attempts>/<node>),
+    # so the due retries can be found by listing a small prefix, instead of keeping an invocation open until then.
+    def __init__(self, bucket_name):
+        super(RetryStatus, self).__init__(bucket_name)
+        self._prefix = 'retries'
+
+    def _get_retry_path(self, run_id, node_name, attempts, due):
+        return '/'.join([self._prefix, f"{due:012d}", run_id, str(attempts), node_name])
+
+    def schedule(self, run_id, node_name, attempts, due: int):
+        self._bucket.blob(self._get_retry_path(run_id, node_name, attempts, due)).upload_from_string('')
+
+    def remove(self, run_id, node_name, attempts, due: int):
+        try:
+            self._bucket.blob(self._get_retry_path(run_id, node_name, attempts, due)).delete()
+        except NotFound:
+            pass
+
+    def get_due_retries(self, now: int):
+        due_retries = []
+        # The objects are listed in the lexicographical order, which is the order of their due times.
+        for blob in self._bucket.list_blobs(prefix=self._prefix + '/'):
+            _, due, run_id, attempts, node_name = blob.name.split('/', 4)
+            if int(due) > now:
+                break
+            due_retries.append({'run_id': run_id, 'node_name': node_name, 'attempts': int(attempts), 'due': int(due)})
+        return due_retries
+
+
+class SlotStatus(Status):
+    # Launch slots that are shared by all the runs (slots/<quoted key>/<index>). A slot is taken by creating its object
+    # only if it doesn't exist yet, so two invocations can never take the same slot, and it's released by deleting it.
+    def __init__(self, bucket_name):
+        super(SlotStatus, self).__init__(bucket_name)
+        self._prefix = 'slots'
+
+    def _get_key_prefix(self, key):
+        return '/'.join([self._prefix, self._quote(key), ''])
+
+    def count(self, key):
+        return sum(1 for _ in self._bucket.list_blobs(prefix=self._get_key_prefix(key)))
+
+    def acquire(self, key, limit, holder):
+        # Returns the slot that was taken ("<path>#<generation>"), or None if all the slots of the key are taken.
+        prefix = self._get_key_prefix(key)
+        taken = {blob.name[len(prefix):] for blob in self._bucket.list_blobs(prefix=prefix)}
+        for index in range(limit):
+            if str(index) in taken:
+                continue
+            slot = prefix + str(index)
+            try:
+                blob = self._bucket.blob(slot)
+                blob.upload_from_string(json.dumps(holder), if_generation_match=0)
+                return f"{slot}#{blob.generation}"
+            except PreconditionFailed:
+                # It was taken by another invocation in the meantime.
+                continue
+        return None
+
+    def release(self, slot):
+        # Returns the key of the released slot, or None if the slot was already released. The generation makes sure
+        # that a late release (i.e. for a duplicate event) never frees the same slot taken by another launch.
+        path, _, generation = slot.partition('#')
+        try:
+            self._bucket.blob(path).delete(if_generation_match=int(generation) if generation else None)
+        except (NotFound, PreconditionFailed):
+            return None
+        return unquote(path[len(self._prefix) + 1:].rsplit('/', 1)[0])
+
+
+class LaunchQueueStatus(Status):
+    # Keeps the launches that are waiting for a slot as empty objects
+    # (launch_queue/<key>/<rank>/<enqueued>/<run_id>/<node_name>/<map_index>), with the key and the node name (i.e. the
+    # scoped names of the SubWorkflow Steps) quoted into single segments. The objects are listed in the lexicographical
+    # order, so the runs with a higher priority come first, and then the oldest launches.
+    MAX_PRIORITY = 999
+    NO_MAP_INDEX = '-'
+    # How long a launch that was taken from the queue waits for its launch, before it's taken again.
+    LEASE_SECONDS = 300
+
+    def __init__(self, bucket_name):
+        super(LaunchQueueStatus, self).__init__(bucket_name)
+        self._prefix = 'launch_queue'
+
+    def _get_key_prefix(self, key):
+        return '/'.join([self._prefix, self._quote(key), ''])
+
+    def push(self, key, run_id, node_name, map_index=None, priority=0, enqueued=None):
+        priority = min(max(int(priority or 0), 0), self.MAX_PRIORITY)
+        enqueued = enqueued or int(time.time() * 1000)
+        path = self._get_key_prefix(key) + '/'.join([
+            f"{self.MAX_PRIORITY - priority:03d}", f"{enqueued:015d}", run_id, self._quote(node_name),
+            self.NO_MAP_INDEX if map_index is None else str(map_index)
+        ])
+        # Pushing a leased launch again overwrites its object without the lease, so it's only released.
+        self._bucket.blob(path).upload_from_string('')
+        return path
+
+    def has_launches(self, key):
+        # Whether any launch is waiting in the queue of the key, including the leased ones that are about to launch.
+        return any(True for _ in self._bucket.list_blobs(prefix=self._get_key_prefix(key), max_results=1))
+
+    def _parse(self, key, name):
+        # A fixed number of fields is parsed from the right, so an unexpected path raises ValueError instead of
+        # shifting the fields.
+        rank, enqueued, run_id, node_name, map_index = name.rsplit('/', 4)
+        return {
+            'key': key,
+            'run_id': run_id,
+            'node_name': unquote(node_name),
+            'map_index': None if map_index == self.NO_MAP_INDEX else int(map_index),
+            'priority': self.MAX_PRIORITY - int(rank),
+            'enqueued': int(enqueued)
+        }
+
+    def pop(self, key, now=None):
+        # Leases and returns the first launch in the queue of the key (if any). The object is only removed (with
+        # remove()) once the launch is done, so a launch whose invocation crashed is taken again when its lease expires.
+        now = now or time.time()
+        prefix = self._get_key_prefix(key)
+        for blob in self._bucket.list_blobs(prefix=prefix):
+            if float((blob.metadata or {}).get('leased_until', 0)) > now:
+                continue
+            try:
+                launch = self._parse(key, blob.name[len(prefix):])
+            except ValueError:
+                # The object is kept, so the launch is not lost.
+                print(f"The queued launch can't be parsed: {blob.name}")
+                continue
+
+            try:
+                blob.metadata = {'leased_until': str(int(now + self.LEASE_SECONDS))}
+                blob.upload_from_string('', if_generation_match=blob.generation)
+            except (NotFound, PreconditionFailed):
+                # It was taken by another invocation.
+                continue
+            launch['entry'] = blob.name
+            return launch
+        return None
+
+    def remove(self, entry):
+        try:
+            self._bucket.blob(entry).delete()
+        except NotFound:
+            pass
@@ -0,0 +1,52 @@
+import time
+import traceback
+
+from .enums import TargetTypes
+from .events import TaskTimeout
+
+
+class TaskWatchdog:
+    # Detects the in-flight executions that are running longer than the `timeout_seconds` of their Steps, i.e. when
+    # the completion log line was dropped or a Dataflow job hangs. It only lists the in-flight markers, which keep the
+    # deadline of each execution in their metadata, so it never reads the runs themselves.
+    TARGET_TYPES = [TargetTypes.CLOUD_FUNCTION, TargetTypes.DATAFLOW_JOB]
+
+    def __init__(self, exec_status):
+        self._exec_status = exec_status
+        self._dataflow = None
+
+    def _get_dataflow(self):
+        if not self._dataflow:
+            from googleapiclient.discovery import build
+            from oauth2client.client import GoogleCredentials
+
+            credentials = GoogleCredentials.get_application_default()
+            self._dataflow = build('dataflow', 'v1b3', credentials=credentials, cache_discovery=False)
+        return self._dataflow
+
+    def sweep(self, now=None):
+        # Returns the timeout events of the executions that are past their deadline.
+        now = now or time.time()
+        events = []
+        for target_type in self.TARGET_TYPES:
+            for execution in self._exec_status.list_in_flight(target_type.value):
+                deadline = execution.get('deadline')
+                if deadline is None or float(deadline) > now:
+                    continue
+
+                print(f"Execution timed out: {execution['execution_id']} ({execution.get('node_name')})")
+                events.append(TaskTimeout.event_data(execution['execution_id'], target_type.value,
+                                                     execution.get('node_name')))
+        return events
+
+    def cancel(self, execution):
+        # A Cloud Function can't be stopped, but a hanging Dataflow job would keep using its workers. It's only called
+        # once the timeout event is accepted, so a stale in-flight marker never cancels a job again.
+        try:
+            self._get_dataflow().projects().locations().jobs().update(
+                projectId=execution.get('project_id'), location=execution.get('region'),
+                jobId=execution['execution_id'], body={'requestedState': 'JOB_STATE_CANCELLED'}
+            ).execute()
+        except Exception as e:
+            print(f"Error in cancelling the Dataflow job: {execution['execution_id']} --> {e}")
+            traceback.print_exc()
@@ -2,16 +2,56 @@ resource "google_pubsub_topic" "orchestrator_dataflow_events" {
   name = join("-", concat(["orchestrator-dataflow-events", var.environment, terraform.workspace]))
 }
 
+locals {
+  # The filters generated from the DAG definition (see sink_filters.auto.tfvars.json), or the generic ones. They are
+  # also passed to the orchestrator function, so the name of the function is not taken from its resource.
+  dataflow_sink_filter = coalesce(var.dataflow_sink_filter, "resource.type=dataflow_step AND (textPayload=\"Worker pool stopped.\" OR textPayload:\"Workflow failed.\" OR textPayload:\"Error occurred in the launcher container: Template launch failed.\" OR textPayload:\"Cancel request is committed for workflow job\")")
+  cloud_function_sink_filter = coalesce(var.cloud_function_sink_filter, "resource.type=\"cloud_function\" NOT resource.labels.function_name=${join("-", concat(["orchestrator", var.environment, terraform.workspace]))}  textPayload: \"Function execution took\" ")
+}
+
 resource "google_logging_project_sink" "dataflow_job_completion_sink" {
   unique_writer_identity = true
   name = join("-", concat(["dataflow-job-completion-sink", var.environment, terraform.workspace]))
   destination = "pubsub.googleapis.com/projects/${var.project}/topics/${google_pubsub_topic.orchestrator_dataflow_events.name}"
-  filter = "resource.type=dataflow_step AND (textPayload=\"Worker pool stopped.\" OR \"Error occurred in the launcher container: Template launch failed. See console logs.\")"
+  filter = local.dataflow_sink_filter
 }
 
 resource "google_logging_project_sink" "cloud_function_completion_sink" {
   unique_writer_identity = true
   name = join("-", concat(["cloud-function-completion-sink", var.environment, terraform.workspace]))
   destination = "pubsub.googleapis.com/projects/${var.project}/topics/${google_pubsub_topic.orchestrator_dataflow_events.name}"
-  filter = "resource.type=\"cloud_function\" NOT resource.labels.function_name=${google_cloudfunctions_function.orchestrator_function.name}  textPayload: \"Function execution took\" "
+  filter = local.cloud_function_sink_filter
+}
+
+resource "google_cloud_scheduler_job" "dataflow_job_poller" {
+  name     = join("-", concat(["dataflow-job-poller", var.environment, terraform.workspace]))
+  schedule = var.dataflow_poll_schedule
+  region   = var.cf_region
+
+  pubsub_target {
+    topic_name = google_pubsub_topic.orchestrator_dataflow_events.id
+    data       = base64encode(jsonencode({ resource = { type = "dataflow_poll" } }))
+  }
+}
+
+resource "google_cloud_scheduler_job" "retry_poller" {
+  name     = join("-", concat(["retry-poller", var.environment, terraform.workspace]))
+  schedule = var.retry_poll_schedule
+  region   = var.cf_region
+
+  pubsub_target {
+    topic_name = google_pubsub_topic.orchestrator_dataflow_events.id
+    data       = base64encode(jsonencode({ resource = { type = "retry_poll" } }))
+  }
+}
+
+resource "google_cloud_scheduler_job" "task_watchdog" {
+  name     = join("-", concat(["task-watchdog", var.environment, terraform.workspace]))
+  schedule = var.watchdog_schedule
+  region   = var.cf_region
+
+  pubsub_target {
+    topic_name = google_pubsub_topic.orchestrator_dataflow_events.id
+    data       = base64encode(jsonencode({ resource = { type = "watchdog" } }))
+  }
 }
@@ -61,6 +61,38 @@ data "archive_file" "orchestrator_file" {
     content  = file("${path.module}/../../code/src/orchestrator/status.py")
     filename = "orchestrator/status.py"
   }
+  source {
+    content  = file("${path.module}/../../code/src/orchestrator/service.py")
+    filename = "orchestrator/service.py"
+  }
+  source {
+    content  = file("${path.module}/../../code/src/orchestrator/dataflow_poller.py")
+    filename = "orchestrator/dataflow_poller.py"
+  }
+  source {
+    content  = file("${path.module}/../../code/src/orchestrator/retry_policy.py")
+    filename = "orchestrator/retry_policy.py"
+  }
+  source {
+    content  = file("${path.module}/../../code/src/orchestrator/launch_limiter.py")
+    filename = "orchestrator/launch_limiter.py"
+  }
+  source {
+    content  = file("${path.module}/../../code/src/orchestrator/watchdog.py")
+    filename = "orchestrator/watchdog.py"
+  }
+  source {
+    content  = file("${path.module}/../../code/src/orchestrator/result_cache.py")
+    filename = "orchestrator/result_cache.py"
+  }
+  source {
+    content  = file("${path.module}/../../code/src/orchestrator/bindings.py")
+    filename = "orchestrator/bindings.py"
+  }
+  source {
+    content  = file("${path.module}/../../code/src/orchestrator/sink_filters.py")
+    filename = "orchestrator/sink_filters.py"
+  }
 }
 
 resource "google_storage_bucket_object" "orchestrator_zip" {
@@ -98,6 +130,9 @@ resource "google_cloudfunctions_function" "orchestrator_function" {
     ENV = var.environment
     OWNER = terraform.workspace
     STATUS_BUCKET = google_storage_bucket.orchestrator_status_bucket.name
+    CONCURRENCY_LIMITS = jsonencode(var.concurrency_limits)
+    DATAFLOW_SINK_FILTER = local.dataflow_sink_filter
+    CLOUD_FUNCTION_SINK_FILTER = local.cloud_function_sink_filter
   }
 
   depends_on = [google_storage_bucket_object.orchestrator_zip]
@@ -18,3 +18,34 @@ variable "environment" {
   default     = "edge"
 }
 
+
+variable "dataflow_poll_schedule" {
+  description = "The schedule of the fallback poller for the Dataflow jobs of the orchestration"
+  default     = "*/5 * * * *"
+}
+
+variable "retry_poll_schedule" {
+  description = "The schedule for launching the due retries of the failed Tasks (and the queued launches with a free slot)"
+  default     = "* * * * *"
+}
+
+variable "watchdog_schedule" {
+  description = "The schedule for failing the Tasks that are running longer than their timeout_seconds"
+  default     = "*/5 * * * *"
+}
+
+variable "concurrency_limits" {
+  description = "The max concurrent executions per target type or target, i.e. {\"Dataflow\" = 20, \"CloudFunction/heavy-function\" = 5}"
+  type        = map(number)
+  default     = {}
+}
+
+variable "dataflow_sink_filter" {
+  description = "The filter of the Dataflow log sink, generated from the DAG definition with: python main.py sink_filters"
+  default     = ""
+}
+
+variable "cloud_function_sink_filter" {
+  description = "The filter of the Cloud Function log sink, generated from the DAG definition with: python main.py sink_filters"
+  default     = ""
+}